@@ -7,8 +7,136 @@
 
 import sys
 import os
-from pathlib import Path
+import io
+import ctypes
+import platform
+import functools
+import importlib.util
+import socket
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 检查项清单，模块加载时构建一次
+_DEPENDENCIES = (
+    ("torch", "PyTorch"),
+    ("torchvision", "TorchVision"),
+    ("transformers", "Transformers"),
+    ("gradio", "Gradio"),
+    ("librosa", "Librosa"),
+    ("soundfile", "SoundFile"),
+    ("PIL", "Pillow"),
+    ("numpy", "NumPy"),
+)
+
+_REQUIRED_DIRS = (
+    ("weights/Wan2.1-I2V-14B-480P", "主模型"),
+    ("weights/chinese-wav2vec2-base", "音频编码器"),
+    ("weights/Kokoro-82M", "TTS模型"),
+    ("weights/Kokoro-82M/voices", "语音模型"),
+)
+
+_VOICE_DIR = "weights/Kokoro-82M/voices"
+_VOICE_FILES = (
+    "af_heart.pt",
+    "am_adam.pt",
+    "af_bella.pt",
+    "am_freeman.pt",
+)
+
+_REQUIRED_FILES = (
+    "distributed_multitalk_app.py",
+    "distributed_generator.py",
+    "distributed_web_interface.py",
+    "distributed_multitalk_core.py",
+    "start_distributed_service.bat",
+    "start_distributed_service.sh",
+)
+
+# torch导入开销较大，在各检查函数之间共享同一个模块引用
+_torch = None
+
+def _import_torch():
+    """延迟导入torch并缓存，未安装时抛出ImportError"""
+    global _torch
+    if _torch is None:
+        import torch
+        _torch = torch
+    return _torch
+
+_CUDA_DRIVER_LIBS = {
+    'Linux': 'libcuda.so.1',
+    'Windows': 'nvcuda.dll',
+}
+
+@functools.lru_cache(maxsize=None)
+def _has_cuda_driver():
+    """通过加载驱动动态库判断CUDA驱动是否存在，无需导入torch或初始化CUDA"""
+    lib = _CUDA_DRIVER_LIBS.get(platform.system())
+    if lib is None:
+        return False
+    try:
+        ctypes.CDLL(lib)
+        return True
+    except OSError:
+        return False
+
+# GPU信息缓存: [(名称, 显存字节数), ...]，由check_cuda填充
+_GPU_INFO = None
+
+def _get_gpu_info():
+    """获取并缓存GPU信息，避免重复查询CUDA驱动"""
+    global _GPU_INFO
+    if _GPU_INFO is None:
+        if not _has_cuda_driver():
+            _GPU_INFO = []
+            return _GPU_INFO
+        torch = _import_torch()
+        _GPU_INFO = [
+            (torch.cuda.get_device_name(i), torch.cuda.get_device_properties(i).total_memory)
+            for i in range(torch.cuda.device_count())
+        ]
+    return _GPU_INFO
+
+def _batch_isdir(paths):
+    """并发检查一组路径是否为目录，结果顺序与输入一致"""
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        return list(ex.map(os.path.isdir, paths))
+
+def _list_files(path):
+    """返回目录下所有普通文件名称的集合，目录不存在时返回空集合"""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name for entry in it if entry.is_file()}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+
+class _ThreadLocalStdout:
+    """按线程重定向输出的stdout代理，未设置缓冲区的线程直接写入原stdout"""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def set_buffer(self, buffer):
+        self._local.buffer = buffer
+    
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        return (buffer or self._stream).write(text)
+    
+    def flush(self):
+        self._stream.flush()
+
+def _run_captured(check_func):
+    """在当前线程中运行检查函数，返回(结果, 输出文本)"""
+    buffer = io.StringIO()
+    sys.stdout.set_buffer(buffer)
+    try:
+        result = check_func()
+    finally:
+        sys.stdout.set_buffer(None)
+    return result, buffer.getvalue()
 
 def check_python_version():
     """检查Python版本"""
@@ -25,15 +153,19 @@ def check_python_version():
 def check_cuda():
     """检查CUDA环境"""
     print("🎮 检查CUDA环境...")
+    if not _has_cuda_driver():
+        print("   ⚠️  未检测到CUDA驱动，跳过GPU检查")
+        return False
     try:
-        import torch
+        torch = _import_torch()
         if torch.cuda.is_available():
-            gpu_count = torch.cuda.device_count()
-            print(f"   ✅ 检测到 {gpu_count} 张GPU")
-            for i in range(gpu_count):
-                gpu_name = torch.cuda.get_device_name(i)
-                gpu_memory = torch.cuda.get_device_properties(i).total_memory // (1024**3)
-                print(f"   GPU {i}: {gpu_name} ({gpu_memory}GB)")
+            gpu_info = _get_gpu_info()
+            lines = [f"   ✅ 检测到 {len(gpu_info)} 张GPU"]
+            lines.extend(
+                f"   GPU {i}: {gpu_name} ({total_memory // (1024**3)}GB)"
+                for i, (gpu_name, total_memory) in enumerate(gpu_info)
+            )
+            print("\n".join(lines))
             return True
         else:
             print("   ⚠️  未检测到CUDA GPU")
@@ -46,119 +178,117 @@ def check_dependencies():
     """检查关键依赖"""
     print("📦 检查关键依赖...")
     
-    dependencies = [
-        ("torch", "PyTorch"),
-        ("torchvision", "TorchVision"),
-        ("transformers", "Transformers"),
-        ("gradio", "Gradio"),
-        ("librosa", "Librosa"),
-        ("soundfile", "SoundFile"),
-        ("PIL", "Pillow"),
-        ("numpy", "NumPy"),
-    ]
+    # 只查找模块规格而不执行导入，避免加载torch/transformers等重量级包
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        specs = list(ex.map(importlib.util.find_spec, [module for module, _ in _DEPENDENCIES]))
     
+    lines = []
     missing = []
-    for module, name in dependencies:
-        try:
-            __import__(module)
-            print(f"   ✅ {name}")
-        except ImportError:
-            print(f"   ❌ {name}")
+    for (module, name), spec in zip(_DEPENDENCIES, specs):
+        if spec is not None:
+            lines.append(f"   ✅ {name}")
+        else:
+            lines.append(f"   ❌ {name}")
             missing.append(name)
     
     if missing:
-        print(f"\n   缺少依赖: {', '.join(missing)}")
-        print("   请运行: pip install -r requirements.txt")
-        return False
+        lines.append(f"\n   缺少依赖: {', '.join(missing)}")
+        lines.append("   请运行: pip install -r requirements.txt")
     
-    return True
+    print("\n".join(lines))
+    return not missing
 
 def check_model_files():
     """检查模型文件"""
     print("🧠 检查模型文件...")
     
-    required_paths = [
-        ("weights/Wan2.1-I2V-14B-480P", "主模型"),
-        ("weights/chinese-wav2vec2-base", "音频编码器"),
-        ("weights/Kokoro-82M", "TTS模型"),
-        ("weights/Kokoro-82M/voices", "语音模型"),
-    ]
-    
+    lines = []
     missing = []
-    for path, name in required_paths:
-        if Path(path).exists():
-            print(f"   ✅ {name}: {path}")
+    for (path, name), exists in zip(_REQUIRED_DIRS, _batch_isdir([p for p, _ in _REQUIRED_DIRS])):
+        if exists:
+            lines.append(f"   ✅ {name}: {path}")
         else:
-            print(f"   ❌ {name}: {path}")
+            lines.append(f"   ❌ {name}: {path}")
             missing.append(name)
     
-    # 检查具体语音文件
-    voice_files = [
-        "weights/Kokoro-82M/voices/af_heart.pt",
-        "weights/Kokoro-82M/voices/am_adam.pt", 
-        "weights/Kokoro-82M/voices/af_bella.pt",
-        "weights/Kokoro-82M/voices/am_freeman.pt",
-    ]
+    # 检查具体语音文件：一次列目录代替逐个stat
+    present = _list_files(_VOICE_DIR)
     
-    for voice_file in voice_files:
-        if Path(voice_file).exists():
-            print(f"   ✅ 语音模型: {Path(voice_file).name}")
+    for voice_file in _VOICE_FILES:
+        if voice_file in present:
+            lines.append(f"   ✅ 语音模型: {voice_file}")
         else:
-            print(f"   ❌ 语音模型: {Path(voice_file).name}")
-            missing.append(f"语音模型 {Path(voice_file).name}")
+            lines.append(f"   ❌ 语音模型: {voice_file}")
+            missing.append(f"语音模型 {voice_file}")
     
+    print("\n".join(lines))
     return len(missing) == 0
 
 def check_service_files():
     """检查服务文件"""
     print("📁 检查服务文件...")
     
-    required_files = [
-        "distributed_multitalk_app.py",
-        "distributed_generator.py",
-        "distributed_web_interface.py", 
-        "distributed_multitalk_core.py",
-        "start_distributed_service.bat",
-        "start_distributed_service.sh",
-    ]
+    present = _list_files(".")
     
+    lines = []
     missing = []
-    for file_path in required_files:
-        if Path(file_path).exists():
-            print(f"   ✅ {file_path}")
+    for file_path in _REQUIRED_FILES:
+        if file_path in present:
+            lines.append(f"   ✅ {file_path}")
         else:
-            print(f"   ❌ {file_path}")
+            lines.append(f"   ❌ {file_path}")
             missing.append(file_path)
     
+    print("\n".join(lines))
     return len(missing) == 0
 
+def _probe_port(port):
+    """两阶段探测端口: 先bind+listen确认可绑定，再connect确认无进程监听"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('0.0.0.0', port))
+            sock.listen(1)
+    except (socket.error, OverflowError):
+        return False
+    
+    # 绑定用的socket已关闭，此时还能连上说明有其他进程在监听
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=0.1):
+            return False
+    except (socket.error, OverflowError):
+        return True
+
 def check_ports():
     """检查端口占用"""
     print("🔌 检查端口状态...")
     
     try:
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('localhost', 8419))
-        sock.close()
-        
-        if result == 0:
-            print("   ⚠️  端口8419已被占用")
-            return False
-        else:
+        if _probe_port(8419):
             print("   ✅ 端口8419可用")
             return True
+        else:
+            print("   ⚠️  端口8419已被占用")
+            return False
     except Exception:
         print("   ⚠️  无法检查端口状态")
         return True
 
+@functools.lru_cache(maxsize=None)
+def _free_gb(path):
+    """获取路径所在文件系统的可用空间(GB)，每次运行只查询一次"""
+    if hasattr(os, 'statvfs'):
+        st = os.statvfs(path)
+        return st.f_bavail * st.f_frsize // (1024**3)
+    import shutil
+    return shutil.disk_usage(path).free // (1024**3)
+
 def check_disk_space():
     """检查磁盘空间"""
     print("💾 检查磁盘空间...")
     
     try:
-        import shutil
-        free_space = shutil.disk_usage('.').free // (1024**3)
+        free_space = _free_gb('.')
         
         if free_space >= 50:
             print(f"   ✅ 可用空间: {free_space}GB")
@@ -176,8 +306,7 @@ def suggest_startup_command():
     print("=" * 50)
     
     try:
-        import torch
-        gpu_count = torch.cuda.device_count()
+        gpu_count = len(_get_gpu_info())
         
         if gpu_count >= 8:
             print("8GPU分布式模式（推荐）:")
@@ -204,10 +333,14 @@ def main():
     print("🔍 分布式MultiTalk环境验证")
     print("=" * 60)
     
-    checks = [
+    # 需要在主线程中顺序执行的检查（CUDA初始化、模块查找）
+    heavy_checks = [
         ("Python版本", check_python_version),
         ("CUDA环境", check_cuda),
         ("依赖包", check_dependencies),
+    ]
+    # 相互独立的文件系统/网络检查，可以并发执行
+    io_checks = [
         ("模型文件", check_model_files),
         ("服务文件", check_service_files),
         ("端口状态", check_ports),
@@ -215,14 +348,31 @@ def main():
     ]
     
     passed = 0
-    total = len(checks)
+    total = len(heavy_checks) + len(io_checks)
     
-    for check_name, check_func in checks:
+    for check_name, check_func in heavy_checks:
         print(f"\n📋 {check_name}:")
         print("-" * 30)
         
         if check_func():
             passed += 1
+    
+    # 并发执行IO检查，各自的输出先缓存，再按原有顺序打印
+    real_stdout = sys.stdout
+    sys.stdout = _ThreadLocalStdout(real_stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=len(io_checks)) as ex:
+            io_results = list(ex.map(_run_captured, [check_func for _, check_func in io_checks]))
+    finally:
+        sys.stdout = real_stdout
+    
+    for (check_name, _), (result, output) in zip(io_checks, io_results):
+        print(f"\n📋 {check_name}:")
+        print("-" * 30)
+        sys.stdout.write(output)
+        
+        if result:
+            passed += 1
             
     print("\n" + "=" * 60)
     print(f"🎯 检查结果: {passed}/{total} 通过")
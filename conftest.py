@@ -0,0 +1,30 @@
+"""pytest公共配置"""
+
+import importlib.util
+import os
+
+import pytest
+
+# 收集和运行测试时默认不暴露GPU，避免每个xdist worker各自初始化CUDA上下文；
+# 需要GPU的运行可显式设置CUDA_VISIBLE_DEVICES覆盖
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+# 测试依赖的项目模块
+REQUIRED_MODULES = (
+    "distributed_multitalk_core",
+    "distributed_generator",
+    "distributed_web_interface",
+)
+
+
+def pytest_collection_modifyitems(session, config, items):
+    """收集阶段用find_spec检查项目模块是否存在（不执行模块代码），缺失时整个会话提前退出"""
+    missing = [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+    if missing:
+        pytest.exit(f"缺少模块: {missing}", returncode=1)
+
+
+def pytest_configure(config):
+    """使用pytest-xdist并行时按文件分发测试，同一文件的测试及其session fixture留在同一个worker"""
+    if getattr(config.option, "numprocesses", None) and config.option.dist in ("no", "load"):
+        config.option.dist = "loadfile"
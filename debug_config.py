@@ -7,42 +7,102 @@
 
 import os
 import logging
-import torch
-import numpy as np
+import importlib
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple, Generator
-from PIL import Image
+
+# 重量级依赖延迟加载，避免仅查看调试配置时也要付出torch/numpy的导入开销
+_LAZY_MODULES = {
+    'torch': 'torch',
+    'np': 'numpy',
+    'Image': 'PIL.Image',
+}
+
+def __getattr__(name):
+    """按需导入重量级模块（PEP 562）"""
+    if name in _LAZY_MODULES:
+        module = importlib.import_module(_LAZY_MODULES[name])
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Mock随机数生成器，首次使用时创建并在之后的调用中复用
+_RNG = None
+
+def _get_rng():
+    """获取模块级随机数生成器"""
+    global _RNG
+    if _RNG is None:
+        import numpy as np
+        _RNG = np.random.default_rng(0)
+    return _RNG
+
+_TORCH_RNG = None
+
+def _get_torch_rng():
+    """获取模块级torch随机数生成器，避免争用全局默认生成器"""
+    global _TORCH_RNG
+    if _TORCH_RNG is None:
+        import torch
+        _TORCH_RNG = torch.Generator().manual_seed(0)
+    return _TORCH_RNG
 
 # 调试模式环境变量
-DEBUG_MODE = os.getenv('MULTITALK_DEBUG', 'false').lower() == 'true'
-MOCK_MODEL_OUTPUTS = os.getenv('MULTITALK_MOCK_OUTPUTS', 'true').lower() == 'true'
+_TRUE_VALUES = frozenset({'1', 'true', 'yes', 'on'})
+
+@dataclass(frozen=True)
+class _EnvConfig:
+    """模块加载时解析一次的调试开关"""
+    debug: bool
+    mock: bool
+
+_CFG = _EnvConfig(
+    debug=os.getenv('MULTITALK_DEBUG', 'false').lower() in _TRUE_VALUES,
+    mock=os.getenv('MULTITALK_MOCK_OUTPUTS', 'true').lower() in _TRUE_VALUES,
+)
+
+# 兼容旧的模块级常量
+DEBUG_MODE = _CFG.debug
+MOCK_MODEL_OUTPUTS = _CFG.mock
 
 class MockWav2VecModel:
     """Mock Wav2Vec2模型，用于调试"""
     
+    __slots__ = ('device', '_gen')
+    
     def __init__(self, *args, **kwargs):
         self.device = kwargs.get('device', 'cpu')
+        self._gen = None  # 实例独立的随机数生成器，首次调用时按当前设备创建
         logging.info("[DEBUG] 使用Mock Wav2Vec2模型")
     
     def __call__(self, audio_array, *args, **kwargs):
         """返回模拟的音频特征"""
+        import torch
+        if self._gen is None:
+            self._gen = torch.Generator(device=torch.device(self.device)).manual_seed(id(self) & 0xFFFFFFFF)
         # 返回固定维度的随机特征向量
         batch_size = 1 if len(audio_array.shape) == 1 else audio_array.shape[0]
         feature_dim = 768  # 典型的Wav2Vec2特征维度
-        return torch.randn(batch_size, feature_dim, device=self.device)
+        return torch.empty(batch_size, feature_dim, device=self.device).normal_(0, 1, generator=self._gen)
     
     def to(self, device):
+        if device != self.device:
+            self._gen = None
         self.device = device
         return self
 
 class MockWav2VecFeatureExtractor:
     """Mock Wav2Vec2特征提取器"""
     
+    __slots__ = ()
+    
     def __init__(self, *args, **kwargs):
         logging.info("[DEBUG] 使用Mock Wav2Vec2特征提取器")
     
     def __call__(self, audio_array, sampling_rate=16000, return_tensors="pt"):
         """返回模拟的输入特征"""
+        import torch
         if isinstance(audio_array, list):
             audio_array = audio_array[0]
         
@@ -54,6 +114,8 @@ class MockWav2VecFeatureExtractor:
 class MockMultiTalkPipeline:
     """Mock MultiTalk管道，用于调试"""
     
+    __slots__ = ('config', 'device_id', 'vram_management')
+    
     def __init__(self, *args, **kwargs):
         self.config = kwargs.get('config')
         self.device_id = kwargs.get('device_id', 0)
@@ -67,6 +129,7 @@ class MockMultiTalkPipeline:
     
     def __call__(self, *args, **kwargs):
         """模拟视频生成"""
+        import numpy as np
         logging.info("[DEBUG] 模拟视频生成中...")
         
         # 返回模拟的视频数据
@@ -74,12 +137,14 @@ class MockMultiTalkPipeline:
         frames = 16
         height, width = 512, 512
         
-        # 生成随机视频帧（RGB格式）
-        video_frames = np.random.randint(0, 255, (frames, height, width, 3), dtype=np.uint8)
+        # 每次调用生成新的随机视频帧（RGB格式）和音频，调用方可以自由修改返回的数组
+        rng = _get_rng()
+        video = rng.integers(0, 256, size=(frames, height, width, 3), dtype=np.uint8)
+        audio = rng.standard_normal(16000 * 5)  # 5秒音频
         
         return {
-            'video': video_frames,
-            'audio': np.random.randn(16000 * 5),  # 5秒音频
+            'video': video,
+            'audio': audio,
             'metadata': {
                 'fps': 8,
                 'duration': frames / 8,
@@ -87,94 +152,148 @@ class MockMultiTalkPipeline:
             }
         }
 
+class MockKPipelineResult:
+    """Mock KPipeline.Result，支持按 (gs, ps, audio) 解包"""
+    
+    __slots__ = ('text_index', 'audio')
+    
+    def __init__(self, text_index, audio):
+        self.text_index = text_index
+        self.audio = audio
+    
+    def __iter__(self):
+        # gs: grapheme sequence, ps: phoneme sequence (均不需要)
+        return iter((None, None, self.audio))
+
+
 class MockKPipeline:
     """Mock Kokoro TTS管道"""
     
+    __slots__ = ()
+    
     def __init__(self, *args, **kwargs):
         logging.info("[DEBUG] 使用Mock Kokoro TTS管道")
     
     def __call__(self, text, voice=None, speed=1.0, split_pattern=None, *args, **kwargs):
-        """模拟TTS生成，返回生成器"""
-        logging.info(f"[DEBUG] 模拟TTS生成: {text[:50]}...")
+        """模拟TTS生成，返回生成器；text可以是字符串或字符串列表"""
+        import torch
+        texts = [text] if isinstance(text, str) else text
+        logging.info(f"[DEBUG] 模拟TTS生成: {texts[0][:50] if texts else ''}...")
         
         # 模拟生成器行为，返回生成器
         def mock_generator():
-            # 根据文本长度生成合适的音频长度
-            text_length = len(text)
-            duration = max(1.0, min(text_length * 0.1, 10.0))  # 0.1秒每字符，最少1秒，最多10秒
             sample_rate = 22050
-            audio_length = int(duration * sample_rate / speed)
-            
-            # 生成模拟的音频波形
-            audio = torch.randn(audio_length) * 0.1
-            
             # 模拟分段生成，每段1-2秒
             segment_length = int(sample_rate * 2 / speed)  # 2秒每段
             
-            for i in range(0, audio_length, segment_length):
-                end_idx = min(i + segment_length, audio_length)
-                audio_segment = audio[i:end_idx]
+            for text_index, item in enumerate(texts):
+                # 根据文本长度生成合适的音频长度
+                duration = max(1.0, min(len(item) * 0.1, 10.0))  # 0.1秒每字符，最少1秒，最多10秒
+                audio_length = int(duration * sample_rate / speed)
                 
-                # 返回 (gs, ps, audio) 格式，模拟真实的KPipeline输出
-                gs = None  # grapheme sequence (不需要)
-                ps = None  # phoneme sequence (不需要)
-                yield gs, ps, audio_segment
+                # 生成模拟的音频波形
+                audio = torch.empty(audio_length).normal_(0, 0.1, generator=_get_torch_rng())
+                
+                # 模拟真实KPipeline的Result输出，text_index对应输入列表中的位置
+                for audio_segment in torch.split(audio, segment_length):
+                    yield MockKPipelineResult(text_index, audio_segment)
         
         return mock_generator()
 
+# Mock类映射，模块加载时构建一次
+_MOCK_CLASSES = {
+    'Wav2Vec2Model': MockWav2VecModel,
+    'Wav2Vec2FeatureExtractor': MockWav2VecFeatureExtractor,
+    'MultiTalkPipeline': MockMultiTalkPipeline,
+    'KPipeline': MockKPipeline
+}
+
 class DebugConfig:
     """调试配置类"""
     
     @staticmethod
     def is_debug_mode() -> bool:
         """检查是否为调试模式"""
-        return DEBUG_MODE
+        return _CFG.debug
     
     @staticmethod
     def should_mock_outputs() -> bool:
         """检查是否应该使用Mock输出"""
-        return MOCK_MODEL_OUTPUTS
+        return _CFG.mock
     
     @staticmethod
     def get_mock_classes() -> Dict[str, Any]:
-        """获取Mock类的映射"""
-        return {
-            'Wav2Vec2Model': MockWav2VecModel,
-            'Wav2Vec2FeatureExtractor': MockWav2VecFeatureExtractor,
-            'MultiTalkPipeline': MockMultiTalkPipeline,
-            'KPipeline': MockKPipeline
-        }
+        """获取Mock类的映射（共享的模块级字典，请勿修改）"""
+        return _MOCK_CLASSES
     
     @staticmethod
     def setup_debug_logging():
         """设置调试日志"""
-        if DEBUG_MODE:
+        if _CFG.debug:
             logging.basicConfig(
                 level=logging.DEBUG,
                 format='[%(asctime)s] [DEBUG] %(message)s',
                 datefmt='%H:%M:%S'
             )
             logging.info("调试模式已启用")
-            logging.info(f"Mock输出: {MOCK_MODEL_OUTPUTS}")
+            logging.info(f"Mock输出: {_CFG.mock}")
+
+def _open_video_writer(output_path: str, fps: int, size: Tuple[int, int]):
+    """按优先级打开视频写入器: NVENC(h264_nvenc) -> avc1 -> mp4v"""
+    import cv2
+    
+    candidates = []
+    try:
+        import torch
+        if torch.cuda.is_available():
+            candidates.append(('avc1', 'video_codec;h264_nvenc'))
+    except ImportError:
+        pass
+    candidates.append(('avc1', None))
+    
+    env_key = 'OPENCV_FFMPEG_WRITER_OPTIONS'
+    for codec, writer_options in candidates:
+        original_options = os.environ.get(env_key)
+        if writer_options is not None:
+            os.environ[env_key] = writer_options
+        try:
+            out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*codec), fps, size)
+        finally:
+            if writer_options is not None:
+                if original_options is None:
+                    os.environ.pop(env_key, None)
+                else:
+                    os.environ[env_key] = original_options
+        if out.isOpened():
+            return out
+        out.release()
+    
+    # 回退到软件MPEG-4编码器
+    return cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
 
 def create_debug_video_output(output_path: str, duration: float = 5.0) -> str:
     """创建调试用的模拟视频文件"""
     import cv2
+    import numpy as np
     
     # 创建一个简单的测试视频
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     fps = 8
     width, height = 512, 512
     
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    out = _open_video_writer(output_path, fps, (width, height))
     
     frames = int(duration * fps)
+    
+    # 预先计算每帧的颜色，所有帧复用同一个缓冲区
+    colors = np.empty((frames, 3), dtype=np.uint8)
+    colors[:, 0] = np.arange(frames) * 255 // max(frames, 1)  # 红色渐变
+    colors[:, 1] = 128  # 固定绿色
+    colors[:, 2] = 255 - colors[:, 0]  # 蓝色反向渐变
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    
     for i in range(frames):
-        # 创建渐变色彩的测试帧
-        frame = np.zeros((height, width, 3), dtype=np.uint8)
-        frame[:, :, 0] = (i * 255 // frames)  # 红色渐变
-        frame[:, :, 1] = 128  # 固定绿色
-        frame[:, :, 2] = 255 - (i * 255 // frames)  # 蓝色反向渐变
+        # 整帧一次性填充，同时清除上一帧的文字
+        frame[:] = colors[i]
         
         # 添加文本标识
         cv2.putText(frame, f'DEBUG FRAME {i+1}/{frames}', 
@@ -188,16 +307,24 @@ def create_debug_video_output(output_path: str, duration: float = 5.0) -> str:
 
 def create_debug_audio_output(output_path: str, duration: float = 5.0, sample_rate: int = 22050) -> str:
     """创建调试用的模拟音频文件"""
+    import numpy as np
     import soundfile as sf
     
-    # 生成简单的正弦波测试音频
-    t = np.linspace(0, duration, int(duration * sample_rate))
+    # 生成简单的正弦波测试音频（float32，原地累加避免多余的临时数组）
+    n = int(duration * sample_rate)
     frequency = 440  # A4音符
-    audio = 0.3 * np.sin(2 * np.pi * frequency * t)
+    step = 2 * np.pi * frequency * duration / max(n - 1, 1)
+    phase = np.arange(n, dtype=np.float32) * np.float32(step)
+    audio = np.sin(phase)
+    audio *= 0.3
     
-    # 添加一些变化使其更有趣
-    audio += 0.1 * np.sin(2 * np.pi * frequency * 2 * t)
-    audio += 0.05 * np.sin(2 * np.pi * frequency * 3 * t)
+    # 添加一些变化使其更有趣（2次、3次谐波）
+    tmp = np.empty_like(phase)
+    for harmonic, amplitude in ((2, 0.1), (3, 0.05)):
+        np.multiply(phase, harmonic, out=tmp)
+        np.sin(tmp, out=tmp)
+        tmp *= amplitude
+        audio += tmp
     
     sf.write(output_path, audio, sample_rate)
     logging.info(f"[DEBUG] 创建调试音频: {output_path}")
@@ -1,8 +1,15 @@
+import hashlib
+import io
 import logging
 import os
+import random
+import shutil
 import sys
 import tempfile
 import uuid
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
 
@@ -10,7 +17,7 @@ import torch
 import torch.distributed as dist
 from PIL import Image
 import numpy as np
-from einops import rearrange
+import cv2
 import soundfile as sf
 import librosa
 
@@ -24,6 +31,118 @@ from distributed_multitalk_core import DialogueScriptParser
 from debug_config import DebugConfig, MockWav2VecModel, MockWav2VecFeatureExtractor, MockMultiTalkPipeline, MockKPipeline
 
 
+# 分布式任务分发的控制标记
+_TASK_STOP = 0
+_TASK_GENERATE = 1
+_CONTROL_TIMEOUT = timedelta(days=7)
+
+# 单机多卡的NCCL默认值：DiT并行中大量小消息，Tree算法延迟更低，更多通道提高并发。
+# 不强制NCCL_PROTO=LL128（NCCL在无NVLink的PCIe平台上出于正确性考虑默认禁用），
+# 也不开启NVLS（需要NVSwitch，RTX-4090不支持）。
+_NCCL_INTRA_NODE_DEFAULTS = {
+    "NCCL_ALGO": "Tree",
+    "NCCL_MIN_NCHANNELS": "4",
+}
+
+# 标准对话格式 "(s1) 台词 (s2) 台词"
+_DIALOGUE_RE = re.compile(r'\(s(\d+)\)\s*(.*?)(?=\s*\(s\d+\)|$)', re.DOTALL)
+
+# 单条台词内按换行分段合成，与KPipeline对字符串输入的默认split_pattern一致
+_TTS_SPLIT_RE = re.compile(r'\n+')
+
+# 对话脚本解析器无状态，全进程共享一个实例
+_DIALOGUE_PARSER = DialogueScriptParser()
+
+# 合成图像缓存：键为两张输入图片内容的BLAKE2b摘要，值为(合成图像, bbox)
+_COMPOSITE_CACHE = OrderedDict()
+_COMPOSITE_CACHE_SIZE = 8
+
+
+def _content_digest(data):
+    """计算文件内容摘要，相同图片即使上传路径不同也命中同一缓存"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _get_composite_image(person1_image_path, person2_image_path):
+    """按输入图片内容缓存合成结果，用户只修改台词/提示词时无需重新合成"""
+    with open(person1_image_path, 'rb') as f:
+        data1 = f.read()
+    with open(person2_image_path, 'rb') as f:
+        data2 = f.read()
+    
+    key = (_content_digest(data1), _content_digest(data2))
+    cached = _COMPOSITE_CACHE.get(key)
+    if cached is not None:
+        _COMPOSITE_CACHE.move_to_end(key)
+        logging.info("复用已缓存的合成图像")
+        return cached
+    
+    result = _build_composite_image(data1, data2)
+    _COMPOSITE_CACHE[key] = result
+    if len(_COMPOSITE_CACHE) > _COMPOSITE_CACHE_SIZE:
+        _COMPOSITE_CACHE.popitem(last=False)
+    return result
+
+
+def _build_composite_image(data1, data2):
+    """由两张图片的原始字节构建横向拼接的合成图像"""
+    logging.info("正在创建合成图像...")
+    
+    # 从已读取的字节解码，避免再次读取文件
+    img1 = np.asarray(Image.open(io.BytesIO(data1)).convert('RGB'))
+    img2 = np.asarray(Image.open(io.BytesIO(data2)).convert('RGB'))
+    
+    # 调整图像大小，保持宽高比
+    target_height = 960  # 720P对应的高度
+    
+    def resize_keep_ratio(img, target_height):
+        height, width = img.shape[:2]
+        new_width = int(width * target_height / height)
+        return cv2.resize(img, (new_width, target_height), interpolation=cv2.INTER_AREA)
+    
+    img1_resized = resize_keep_ratio(img1, target_height)
+    img2_resized = resize_keep_ratio(img2, target_height)
+    width1 = img1_resized.shape[1]
+    
+    # 直接写入预分配的画布完成横向拼接
+    total_width = width1 + img2_resized.shape[1]
+    canvas = np.empty((target_height, total_width, 3), dtype=np.uint8)
+    canvas[:, :width1] = img1_resized
+    canvas[:, width1:] = img2_resized
+    # 合成图像直接以内存对象交给管道，省去PNG编码写盘和再次解码
+    composite = Image.fromarray(canvas)
+    
+    # 生成bbox信息用于指定人物位置
+    bbox_info = {
+        "person1": [0, 0, width1, target_height],
+        "person2": [width1, 0, total_width, target_height]
+    }
+    
+    logging.info(f"合成图像创建完成: {total_width}x{target_height}")
+    return composite, bbox_info
+
+
+def _mirror_checkpoint(src_dir, dst_dir):
+    """把检查点目录镜像到缓存目录（如/dev/shm），大小和修改时间一致的文件直接跳过"""
+    for root, _, files in os.walk(src_dir):
+        target_root = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            src_stat = os.stat(src)
+            try:
+                dst_stat = os.stat(dst)
+                if dst_stat.st_size == src_stat.st_size and int(dst_stat.st_mtime) == int(src_stat.st_mtime):
+                    continue
+            except FileNotFoundError:
+                pass
+            # 先写临时文件再原子替换，中断的拷贝不会被当作有效缓存
+            tmp = dst + ".tmp"
+            shutil.copy2(src, tmp)
+            os.replace(tmp, dst)
+
+
 class DistributedMultiTalkGenerator:
     """分布式MultiTalk视频生成器"""
     
@@ -39,11 +158,16 @@ class DistributedMultiTalkGenerator:
         
         self.setup_distributed()
         self.setup_models()
-        self.dialogue_parser = DialogueScriptParser()
+        self.dialogue_parser = _DIALOGUE_PARSER
         
         # 创建临时目录
         self.temp_dir = Path(tempfile.gettempdir()) / "multitalk_distributed"
         self.temp_dir.mkdir(exist_ok=True)
+        
+        # 后台写盘线程池，embedding保存与后续准备工作重叠，render_video读取前再等待
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="multitalk_io")
+        # 尚未写完的embedding文件: 路径 -> Future
+        self._pending_saves = {}
     
     def setup_distributed(self):
         """设置分布式环境"""
@@ -58,8 +182,12 @@ class DistributedMultiTalkGenerator:
             self.args.offload_model = False if self.world_size > 1 else True
             logging.info(f"offload_model设置为: {self.args.offload_model}")
         
+        if self.args.ulysses_size is None:
+            self._resolve_sequence_parallel()
+        
         if self.world_size > 1:
             torch.cuda.set_device(self.local_rank)
+            self._apply_nccl_defaults()
             dist.init_process_group(
                 backend="nccl",
                 init_method="env://",
@@ -67,6 +195,9 @@ class DistributedMultiTalkGenerator:
                 world_size=self.world_size
             )
             logging.info(f"分布式环境初始化完成: rank={self.rank}, world_size={self.world_size}")
+            # 任务分发使用独立的gloo控制组：空闲的工作进程可能长时间等待下一个任务，
+            # NCCL集合通信会因超时被watchdog终止
+            self.control_group = dist.new_group(backend="gloo", timeout=_CONTROL_TIMEOUT)
         else:
             assert not (self.args.t5_fsdp or self.args.dit_fsdp), \
                 "单GPU环境不支持FSDP"
@@ -90,6 +221,116 @@ class DistributedMultiTalkGenerator:
             )
             logging.info(f"并行计算环境初始化完成: ulysses={self.args.ulysses_size}, ring={self.args.ring_size}")
     
+    def _resolve_sequence_parallel(self):
+        """
+        未显式指定ulysses_size时自动划分序列并行度：
+        优先把Ring之外的全部GPU用于Ulysses；若注意力头数无法整除，
+        则取能整除头数的最大Ulysses度，其余GPU并入Ring，组成USP(Ring x Ulysses)
+        """
+        num_heads = WAN_CONFIGS[self.args.task].num_heads
+        sp_size = max(self.world_size // self.args.ring_size, 1)
+        ulysses_size = max(d for d in range(1, sp_size + 1)
+                           if sp_size % d == 0 and num_heads % d == 0)
+        if ulysses_size != sp_size:
+            logging.warning(
+                f"注意力头数{num_heads}无法被{sp_size}整除，"
+                f"改用USP: ulysses={ulysses_size}, ring={self.args.ring_size * sp_size // ulysses_size}"
+            )
+        self.args.ulysses_size = ulysses_size
+        self.args.ring_size = self.args.ring_size * sp_size // ulysses_size
+        logging.info(f"序列并行度设置为: ulysses={self.args.ulysses_size}, ring={self.args.ring_size}")
+    
+    def _cache_checkpoint(self, ckpt_dir):
+        """将检查点镜像到ckpt_cache_dir（tmpfs），服务重启后直接从内存文件系统加载
+        
+        每个节点只由local_rank 0拷贝，其余进程在barrier后使用缓存路径。
+        """
+        cache_dir = os.path.join(self.args.ckpt_cache_dir, os.path.basename(os.path.normpath(ckpt_dir)))
+        if self.local_rank == 0:
+            logging.info(f"正在同步检查点缓存: {ckpt_dir} -> {cache_dir}")
+            _mirror_checkpoint(ckpt_dir, cache_dir)
+        if dist.is_initialized():
+            dist.barrier()
+        logging.info(f"使用检查点缓存: {cache_dir}")
+        return cache_dir
+    
+    def _resolve_quant(self):
+        """未指定--quant时，若quant_dir下有预量化的FP8 DiT权重则默认使用
+
+        量化模型仅支持单GPU；指定了--lora_dir时量化加载路径会把LoRA当作完整的量化模型读取，
+        因此不自动启用。
+        """
+        if self.args.quant is not None:
+            logging.info(f"使用指定的量化类型: {self.args.quant}")
+            return
+        if not self.args.quant_dir:
+            return
+        fp8_path = os.path.join(self.args.quant_dir, "quant_models", "dit_model_fp8.safetensors")
+        if not os.path.isfile(fp8_path):
+            return
+        if self.world_size > 1:
+            logging.info(f"检测到FP8量化权重，但量化模型仅支持单GPU，不自动启用 ({fp8_path})")
+        elif self.args.lora_dir:
+            logging.info(f"检测到FP8量化权重，但指定了--lora_dir，不自动启用 ({fp8_path})")
+        else:
+            self.args.quant = "fp8"
+            logging.info(f"检测到FP8量化权重，quant设置为: fp8 ({fp8_path})")
+    
+    def _apply_nccl_defaults(self):
+        """单机多卡时为NCCL设置低延迟默认值，已存在的环境变量优先"""
+        local_world_size = int(os.getenv("LOCAL_WORLD_SIZE", self.world_size))
+        if local_world_size != self.world_size:
+            return
+        for key, value in _NCCL_INTRA_NODE_DEFAULTS.items():
+            os.environ.setdefault(key, value)
+        logging.info("NCCL配置: " + ", ".join(f"{k}={os.environ[k]}" for k in _NCCL_INTRA_NODE_DEFAULTS))
+    
+    def run_worker_loop(self):
+        """非主进程的任务循环：等待rank 0广播任务后协同执行MultiTalk管道"""
+        logging.info(f"进程 {self.rank} 进入任务等待循环")
+        while True:
+            tag = torch.zeros(1, dtype=torch.long)
+            dist.broadcast(tag, src=0, group=self.control_group)
+            if tag.item() == _TASK_STOP:
+                logging.info(f"进程 {self.rank} 收到退出信号")
+                break
+            
+            payload = [None]
+            dist.broadcast_object_list(payload, src=0, group=self.control_group)
+            input_data, generate_kwargs = payload[0]
+            try:
+                self._run_pipeline(input_data, generate_kwargs)
+            except Exception as e:
+                logging.error(f"进程 {self.rank} 执行生成任务时发生错误: {e}")
+    
+    def shutdown_workers(self):
+        """由rank 0调用，通知所有工作进程退出任务循环"""
+        if self.world_size > 1 and self.rank == 0:
+            tag = torch.tensor([_TASK_STOP], dtype=torch.long)
+            dist.broadcast(tag, src=0, group=self.control_group)
+    
+    def _broadcast_task(self, input_data, generate_kwargs):
+        """由rank 0调用，把生成任务分发给所有工作进程"""
+        tag = torch.tensor([_TASK_GENERATE], dtype=torch.long)
+        dist.broadcast(tag, src=0, group=self.control_group)
+        dist.broadcast_object_list([(input_data, generate_kwargs)], src=0, group=self.control_group)
+    
+    def _run_pipeline(self, input_data, generate_kwargs):
+        """执行MultiTalk管道生成，所有rank需以相同参数同时调用"""
+        return self.wan_pipeline.generate(
+            input_data,
+            size_buckget="multitalk-720",  # 使用720P分辨率
+            motion_frame=self.args.motion_frame,
+            frame_num=self.args.frame_num,
+            shift=self.args.sample_shift,
+            offload_model=self.args.offload_model,
+            max_frames_num=self.args.frame_num,
+            color_correction_strength=self.args.color_correction_strength,
+            extra_args=self.args,
+            generator=self.noise_generator,
+            **generate_kwargs,
+        )
+    
     def setup_models(self):
         """初始化模型"""
         cfg = WAN_CONFIGS[self.args.task]
@@ -98,20 +339,45 @@ class DistributedMultiTalkGenerator:
             assert cfg.num_heads % self.args.ulysses_size == 0, \
                 f"注意力头数{cfg.num_heads}无法被ulysses_size{self.args.ulysses_size}整除"
         
+        self._resolve_quant()
+        
         logging.info(f"生成任务参数: {self.args}")
         logging.info(f"模型配置: {cfg}")
         
         if dist.is_initialized():
-            base_seed = [self.args.base_seed] if self.rank == 0 else [None]
-            dist.broadcast_object_list(base_seed, src=0)
-            self.args.base_seed = base_seed[0]
+            # 单个整数直接以张量广播，避免broadcast_object_list的pickle开销
+            seed_tensor = torch.tensor(
+                [self.args.base_seed if self.rank == 0 else 0],
+                dtype=torch.long, device=f"cuda:{self.local_rank}"
+            )
+            dist.broadcast(seed_tensor, src=0)
+            self.args.base_seed = int(seed_tensor.item())
+        
+        # 每个rank在本地GPU上复用一个噪声生成器，每次生成只重新设置种子，
+        # 不再重置全局torch/CUDA随机数状态
+        self.noise_generator = None
+        if not self.debug_mode:
+            self.noise_generator = torch.Generator(device=f"cuda:{self.local_rank}")
         
         # 初始化音频相关模型
         self.wav2vec_feature_extractor, self.audio_encoder = self._init_audio_models()
+        self.tts_pipeline = self._init_tts_pipeline()
+        self._voice_cache = {}
         
         # 创建音频保存目录
         os.makedirs(self.args.audio_save_dir, exist_ok=True)
         
+        if self.args.ckpt_cache_dir and not self.debug_mode:
+            self.args.ckpt_dir = self._cache_checkpoint(self.args.ckpt_dir)
+        
+        if self.args.offload_type == "block_level":
+            assert not self.args.dit_fsdp, "block_level卸载不支持与DiT FSDP同时使用，请添加--no-dit_fsdp"
+        if self.args.compile:
+            # shard_model中的FSDP分片未设置use_orig_params=True，torch.compile无法追踪；
+            # block_level卸载注册的前向hook会被一并编译进图，在加载权重之前拒绝这两种组合
+            assert not self.args.dit_fsdp, "--compile不支持与DiT FSDP同时使用，请添加--no-dit_fsdp"
+            assert self.args.offload_type != "block_level", "--compile不支持与block_level卸载同时使用"
+        
         # 初始化MultiTalk管道
         if self.debug_mode:
             logging.info("[DEBUG] 使用Mock MultiTalk管道")
@@ -130,14 +396,29 @@ class DistributedMultiTalkGenerator:
                 t5_cpu=self.args.t5_cpu,
                 lora_dir=self.args.lora_dir,
                 lora_scales=self.args.lora_scale,
-                quant=self.args.quant
+                quant=self.args.quant,
+                block_offload=(self.args.offload_type == "block_level"),
             )
             
-            if self.args.num_persistent_param_in_dit is not None:
+            if self.args.offload_type == "block_level":
+                logging.info(f"启用DiT分组卸载: 每组{self.args.num_blocks_per_group}个block, "
+                             f"异步流={self.args.use_stream}")
+                self.wan_pipeline.enable_block_offload(
+                    num_blocks_per_group=self.args.num_blocks_per_group,
+                    use_stream=self.args.use_stream
+                )
+            elif self.args.num_persistent_param_in_dit is not None:
                 self.wan_pipeline.vram_management = True
                 self.wan_pipeline.enable_vram_management(
                     num_persistent_param_in_dit=self.args.num_persistent_param_in_dit
                 )
+            
+            if self.args.compile:
+                # 逐block原地编译：输入形状固定(720P/固定帧数)，关闭动态形状；
+                # USP注意力中的集合通信会产生graph break，因此不使用fullgraph
+                logging.info(f"正在编译DiT blocks: mode={self.args.compile_mode}")
+                for block in self.wan_pipeline.model.blocks:
+                    block.compile(mode=self.args.compile_mode, dynamic=False)
         
         logging.info("模型初始化完成！")
     
@@ -156,163 +437,158 @@ class DistributedMultiTalkGenerator:
         """初始化音频相关模型"""
         if self.debug_mode:
             logging.info("[DEBUG] 使用Mock音频模型")
+            self.audio_device = torch.device('cpu')
             audio_encoder = MockWav2VecModel(device='cpu')
             wav2vec_feature_extractor = MockWav2VecFeatureExtractor()
         else:
             logging.info("正在加载音频模型...")
-            audio_encoder = Wav2Vec2Model.from_pretrained(
-                self.args.wav2vec_dir, local_files_only=True
-            ).to('cpu')
+            # 音频编码器放在本进程的GPU上，无GPU时退回CPU
+            if torch.cuda.is_available():
+                self.audio_device = torch.device(f"cuda:{self.local_rank}")
+            else:
+                self.audio_device = torch.device('cpu')
+            
+            if self.audio_device.type == 'cuda' and not getattr(self.args, 'wav2vec_fp32', False):
+                # 以BF16权重直接加载到目标GPU，避免先在CPU上构建FP32模型再整体拷贝
+                audio_encoder = Wav2Vec2Model.from_pretrained(
+                    self.args.wav2vec_dir, local_files_only=True,
+                    torch_dtype=torch.bfloat16, device_map={'': self.audio_device}
+                ).eval()
+            else:
+                audio_encoder = Wav2Vec2Model.from_pretrained(
+                    self.args.wav2vec_dir, local_files_only=True
+                ).to(self.audio_device).eval()
             audio_encoder.feature_extractor._freeze_parameters()
             wav2vec_feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(
                 self.args.wav2vec_dir, local_files_only=True
             )
+        # 音频编码使用独立CUDA流，可与同一GPU上正在进行的DiT生成重叠；
+        # 先同步一次，确保权重加载在默认流上已完成
+        self.audio_stream = None
+        if self.audio_device.type == 'cuda':
+            torch.cuda.synchronize(self.audio_device)
+            self.audio_stream = torch.cuda.Stream(self.audio_device)
         logging.info("音频模型加载完成")
         return wav2vec_feature_extractor, audio_encoder
     
+    def _init_tts_pipeline(self):
+        """初始化TTS管道，只在启动时加载一次Kokoro模型"""
+        if self.debug_mode:
+            logging.info("[DEBUG] 使用Mock TTS管道")
+            return MockKPipeline()
+        logging.info("正在加载TTS模型...")
+        pipeline = KPipeline(lang_code='a', repo_id='weights/Kokoro-82M')
+        logging.info("TTS模型加载完成")
+        return pipeline
+    
+    def _load_voice(self, voice_path):
+        """加载语音张量，按(路径, 修改时间)缓存，文件未更新时不再读取磁盘
+        
+        语音张量保留在CPU上：KPipeline.load_voice只接受CPU FloatTensor，
+        并在推理时自行移动到模型所在设备。
+        """
+        key = (voice_path, os.path.getmtime(voice_path))
+        voice_tensor = self._voice_cache.get(key)
+        if voice_tensor is None:
+            voice_tensor = torch.load(voice_path, weights_only=True, map_location='cpu')
+            self._voice_cache[key] = voice_tensor
+        return voice_tensor
+    
+    def preload_voices(self, voice_paths):
+        """启动时预先加载语音张量，首个请求无需读取磁盘；不存在的文件跳过"""
+        for voice_path in voice_paths:
+            if os.path.isfile(voice_path):
+                self._load_voice(voice_path)
+            else:
+                logging.warning(f"[WARNING] 语音文件不存在，跳过预加载: {voice_path}")
+    
     def create_composite_image(self, person1_image_path, person2_image_path):
-        """创建包含两个人物的合成图像"""
+        """创建包含两个人物的合成图像，相同输入图片直接复用缓存结果"""
         try:
-            logging.info("正在创建合成图像...")
-            
-            # 读取两个图像
-            img1 = Image.open(person1_image_path).convert('RGB')
-            img2 = Image.open(person2_image_path).convert('RGB')
-            
-            # 调整图像大小，保持宽高比
-            target_height = 960  # 720P对应的高度
-            
-            def resize_keep_ratio(img, target_height):
-                ratio = target_height / img.height
-                new_width = int(img.width * ratio)
-                return img.resize((new_width, target_height), Image.Resampling.LANCZOS)
-            
-            img1_resized = resize_keep_ratio(img1, target_height)
-            img2_resized = resize_keep_ratio(img2, target_height)
-            
-            # 创建横向拼接的合成图像
-            total_width = img1_resized.width + img2_resized.width
-            composite = Image.new('RGB', (total_width, target_height))
-            
-            # 拼接图像
-            composite.paste(img1_resized, (0, 0))
-            composite.paste(img2_resized, (img1_resized.width, 0))
-            
-            # 保存合成图像
-            composite_path = self.temp_dir / f"composite_{uuid.uuid4().hex}.png"
-            composite.save(composite_path)
-            
-            # 生成bbox信息用于指定人物位置
-            bbox_info = {
-                "person1": [0, 0, img1_resized.width, target_height],
-                "person2": [img1_resized.width, 0, total_width, target_height]
-            }
-            
-            logging.info(f"合成图像创建完成: {composite_path}")
-            return str(composite_path), bbox_info
+            composite, bbox_info = _get_composite_image(person1_image_path, person2_image_path)
+            # bbox为可变对象，返回副本避免调用方修改缓存内容
+            return composite, {name: list(box) for name, box in bbox_info.items()}
             
         except Exception as e:
             logging.error(f"创建合成图像时发生错误: {e}")
             raise
     
+    @torch.inference_mode()
     def generate_tts_audio(self, dialogue_text, voice1_path, voice2_path):
         """生成TTS音频"""
         try:
             logging.info("正在生成TTS音频...")
             
             # 解析对话
-            pattern = r'\(s(\d+)\)\s*(.*?)(?=\s*\(s\d+\)|$)'
-            matches = re.findall(pattern, dialogue_text, re.DOTALL)
-            
-            s1_sentences = []
-            s2_sentences = []
-            
-            if self.debug_mode:
-                logging.info("[DEBUG] 使用Mock TTS管道")
-                pipeline = MockKPipeline()
-            else:
-                pipeline = KPipeline(lang_code='a', repo_id='weights/Kokoro-82M')
-            
-            for speaker, content in matches:
+            pipeline = self.tts_pipeline
+            voice_paths = {'1': voice1_path, '2': voice2_path}
+            lines = []
+            for speaker, content in _DIALOGUE_RE.findall(dialogue_text):
                 content = content.strip()
-                if not content:
+                if content and speaker in voice_paths:
+                    lines.append((speaker, content))
+            
+            # 第一遍：每位说话人的全部台词合并为一次管道调用，
+            # 按结果的text_index放回原始顺序；保留分块，第二遍直接写入时间线
+            line_chunks = [[] for _ in lines]
+            for speaker, voice_path in voice_paths.items():
+                indices = [i for i, (s, _) in enumerate(lines) if s == speaker]
+                if not indices:
                     continue
-                    
-                if speaker == '1':
-                    voice_tensor = torch.load(voice1_path, weights_only=True)
-                    generator = pipeline(content, voice=voice_tensor, speed=1, split_pattern=r'\n+')
-                    audios = []
-                    for gs, ps, audio in generator:
-                        if audio is not None and audio.numel() > 0:
-                            audios.append(audio)
-                    
-                    if audios:
-                        audios = torch.concat(audios, dim=0)
-                        s1_sentences.append(audios)
-                        s2_sentences.append(torch.zeros_like(audios))
-                    else:
-                        logging.warning(f"[WARNING] 说话人1的内容'{content}'没有生成有效音频")
-                    
-                elif speaker == '2':
-                    voice_tensor = torch.load(voice2_path, weights_only=True)
-                    generator = pipeline(content, voice=voice_tensor, speed=1, split_pattern=r'\n+')
-                    audios = []
-                    for gs, ps, audio in generator:
-                        if audio is not None and audio.numel() > 0:
-                            audios.append(audio)
-                    
-                    if audios:
-                        audios = torch.concat(audios, dim=0)
-                        s2_sentences.append(audios)
-                        s1_sentences.append(torch.zeros_like(audios))
-                    else:
-                        logging.warning(f"[WARNING] 说话人2的内容'{content}'没有生成有效音频")
-            
-            if not s1_sentences and not s2_sentences:
-                raise ValueError("对话脚本中没有找到有效的对话内容")
-            
-            # 处理空列表的情况
-            if s1_sentences:
-                s1_audio = torch.concat(s1_sentences, dim=0)
-            else:
-                logging.warning("[WARNING] 说话人1没有有效音频，使用静音")
-                # 创建与s2相同长度的静音
-                if s2_sentences:
-                    s2_temp = torch.concat(s2_sentences, dim=0)
-                    s1_audio = torch.zeros_like(s2_temp)
+                voice_tensor = self._load_voice(voice_path)
+                # 列表输入不会再按换行切分，这里预先把多行台词拆成多段，
+                # owners记录每段所属的台词序号
+                texts, owners = [], []
+                for i in indices:
+                    for piece in _TTS_SPLIT_RE.split(lines[i][1]):
+                        piece = piece.strip()
+                        if piece:
+                            texts.append(piece)
+                            owners.append(i)
+                for result in pipeline(texts, voice=voice_tensor, speed=1):
+                    audio = result.audio
+                    if audio is not None and audio.numel() > 0:
+                        line_chunks[owners[result.text_index]].append(audio)
+            
+            segments = []
+            for (speaker, content), chunks in zip(lines, line_chunks):
+                if chunks:
+                    segments.append((speaker, chunks))
                 else:
-                    s1_audio = torch.zeros(24000)  # 1秒静音
+                    logging.warning(f"[WARNING] 说话人{speaker}的内容'{content}'没有生成有效音频")
             
-            if s2_sentences:
-                s2_audio = torch.concat(s2_sentences, dim=0)
-            else:
-                logging.warning("[WARNING] 说话人2没有有效音频，使用静音")
-                # 创建与s1相同长度的静音
-                s2_audio = torch.zeros_like(s1_audio)
-            
-            # 确保两个音频长度一致
-            min_length = min(len(s1_audio), len(s2_audio))
-            s1_audio = s1_audio[:min_length]
-            s2_audio = s2_audio[:min_length]
+            if not segments:
+                raise ValueError("对话脚本中没有找到有效的对话内容")
             
-            sum_sentences = s1_audio + s2_audio
+            # 第二遍：写入预分配的时间线，另一位说话人对应区间保持静音
+            total_length = sum(chunk.shape[0] for _, chunks in segments for chunk in chunks)
+            # 两位说话人的区间互不重叠，混合音轨即各段按顺序拼接，无需相加
+            # 两条单人音轨共用一块 (2, T) 缓冲区，便于后续一次性重采样
+            tracks = torch.zeros(2, total_length)
+            s1_audio, s2_audio = tracks
+            sum_sentences = torch.empty(total_length)
+            offset = 0
+            for speaker, chunks in segments:
+                target = s1_audio if speaker == '1' else s2_audio
+                for chunk in chunks:
+                    end = offset + chunk.shape[0]
+                    target[offset:end] = chunk
+                    sum_sentences[offset:end] = chunk
+                    offset = end
             
             # 保存音频文件
             session_id = uuid.uuid4().hex
             save_dir = self.temp_dir / session_id
             save_dir.mkdir(exist_ok=True)
             
-            save_path1 = save_dir / 's1.wav'
-            save_path2 = save_dir / 's2.wav'
+            # 下游只使用混合音轨；s1/s2仅在内存中用于提取embedding
             save_path_sum = save_dir / 'sum.wav'
+            sum_int16 = (sum_sentences.clamp(-1, 1) * 32767).to(torch.int16).numpy()
+            sf.write(save_path_sum, sum_int16, 24000, subtype='PCM_16')
             
-            sf.write(save_path1, s1_audio, 24000)
-            sf.write(save_path2, s2_audio, 24000)
-            sf.write(save_path_sum, sum_sentences, 24000)
-            
-            # 转换为16kHz用于embedding
-            s1, _ = librosa.load(save_path1, sr=16000)
-            s2, _ = librosa.load(save_path2, sr=16000)
+            # 直接在内存中重采样到16kHz用于embedding，无需重新读取wav文件；
+            # 两条音轨作为双通道一次调用，共享重采样滤波器的构建
+            s1, s2 = librosa.resample(tracks.numpy(), orig_sr=24000, target_sr=16000)
             
             logging.info(f"TTS音频生成完成: {save_dir}")
             return s1, s2, str(save_path_sum), str(save_dir)
@@ -323,27 +599,82 @@ class DistributedMultiTalkGenerator:
     
     def get_audio_embedding(self, speech_array, sr=16000):
         """获取音频embedding"""
+        return self.get_audio_embeddings_batched([speech_array], sr=sr)[0]
+    
+    @torch.inference_mode()
+    def get_audio_embeddings_batched(self, speech_arrays, sr=16000):
+        """批量获取多路音频的embedding，等长的音频合并为一次前向计算
+        
+        Args:
+            speech_arrays (list): 16kHz音频数组列表
+            sr (int): 采样率
+            
+        Returns:
+            list: 与输入顺序一致的embedding列表，每个形状为 (seq_len, num_layers, hidden_dim)
+        """
         try:
-            # 检查输入音频是否为空
-            if speech_array is None or len(speech_array) == 0:
-                logging.warning("[WARNING] 输入音频为空，返回默认embedding")
-                # 返回默认的embedding形状 (seq_len, batch_size, hidden_dim)
-                default_seq_len = 100  # 默认序列长度
-                default_hidden_dim = 768  # 默认隐藏维度
-                return torch.zeros(default_seq_len, 1, default_hidden_dim)
-            
-            audio_duration = len(speech_array) / sr
-            video_length = audio_duration * 25  # 假设视频fps为25
-            
-            # wav2vec特征提取
-            audio_feature = np.squeeze(
-                self.wav2vec_feature_extractor(speech_array, sampling_rate=sr).input_values
-            )
-            audio_feature = torch.from_numpy(audio_feature).float().to(device='cpu')
-            audio_feature = audio_feature.unsqueeze(0)
+            # 特征提取已在编码器设备上用torch完成，这里保留HF特征提取器的采样率校验
+            expected_sr = getattr(self.wav2vec_feature_extractor, 'sampling_rate', sr)
+            if sr != expected_sr:
+                raise ValueError(f"wav2vec要求{expected_sr}Hz音频，实际为{sr}Hz")
+            
+            embeddings = [None] * len(speech_arrays)
+            
+            # 按长度分组：编码器的seq_len对整个batch生效，只有等长音频可以合批
+            groups = {}
+            for idx, speech_array in enumerate(speech_arrays):
+                if speech_array is None or len(speech_array) == 0:
+                    logging.warning("[WARNING] 输入音频为空，返回默认embedding")
+                    # 返回默认的embedding形状 (seq_len, batch_size, hidden_dim)
+                    default_seq_len = 100  # 默认序列长度
+                    default_hidden_dim = 768  # 默认隐藏维度
+                    embeddings[idx] = torch.zeros(default_seq_len, 1, default_hidden_dim)
+                else:
+                    groups.setdefault(len(speech_array), []).append(idx)
+            
+            for length, indices in groups.items():
+                batch = [speech_arrays[idx] for idx in indices]
+                for idx, audio_emb in zip(indices, self._encode_audio_batch(batch, sr)):
+                    embeddings[idx] = audio_emb
+            
+            return embeddings
             
-            # 音频编码
-            with torch.no_grad():
+        except Exception as e:
+            logging.error(f"获取音频embedding时发生错误: {e}")
+            raise
+    
+    @staticmethod
+    def _normalize_audio(audio_feature):
+        """逐条零均值单位方差归一化，与Wav2Vec2FeatureExtractor(do_normalize=True)一致"""
+        mean = audio_feature.mean(dim=-1, keepdim=True)
+        var = audio_feature.var(dim=-1, unbiased=False, keepdim=True)
+        return (audio_feature - mean) / torch.sqrt(var + 1e-7)
+    
+    def _encode_audio_batch(self, speech_arrays, sr):
+        """对一组等长音频执行一次wav2vec特征提取和编码"""
+        audio_duration = len(speech_arrays[0]) / sr
+        video_length = audio_duration * 25  # 假设视频fps为25
+        
+        # torch.cuda.stream(None)不做任何事，CPU上直接在当前上下文执行
+        with torch.cuda.stream(self.audio_stream):
+            # 输入直接写入锁页内存后异步拷贝到GPU，省去np.stack的中间副本
+            on_cuda = self.audio_device.type == 'cuda'
+            host_feature = torch.empty(
+                (len(speech_arrays), len(speech_arrays[0])), dtype=torch.float32, pin_memory=on_cuda
+            )
+            for row, speech_array in zip(host_feature, speech_arrays):
+                row.copy_(torch.from_numpy(np.asarray(speech_array)))
+            
+            # wav2vec特征提取：直接在编码器所在设备上完成归一化
+            audio_feature = host_feature.to(self.audio_device, non_blocking=on_cuda)
+            if getattr(self.wav2vec_feature_extractor, 'do_normalize', True):
+                audio_feature = self._normalize_audio(audio_feature)
+            
+            # 音频编码，GPU上使用BF16自动混合精度
+            use_autocast = self.audio_device.type == 'cuda'
+            with torch.autocast(
+                device_type=self.audio_device.type, dtype=torch.bfloat16, enabled=use_autocast
+            ):
                 embeddings = self.audio_encoder(
                     audio_feature, seq_len=int(video_length), output_hidden_states=True
                 )
@@ -352,40 +683,59 @@ class DistributedMultiTalkGenerator:
                 logging.warning("[WARNING] 音频编码器返回空结果，返回默认embedding")
                 default_seq_len = max(1, int(video_length))
                 default_hidden_dim = 768
-                return torch.zeros(default_seq_len, 1, default_hidden_dim)
-            
-            # 检查hidden_states是否有足够的层
-            hidden_states_to_stack = embeddings.hidden_states[1:]
-            if len(hidden_states_to_stack) == 0:
-                logging.warning("[WARNING] 没有足够的hidden states，返回默认embedding")
-                default_seq_len = max(1, int(video_length))
-                default_hidden_dim = 768
-                return torch.zeros(default_seq_len, 1, default_hidden_dim)
-            
-            audio_emb = torch.stack(hidden_states_to_stack, dim=1).squeeze(0)
-            audio_emb = rearrange(audio_emb, "b s d -> s b d")
-            audio_emb = audio_emb.cpu().detach()
-            
-            return audio_emb
-            
-        except Exception as e:
-            logging.error(f"获取音频embedding时发生错误: {e}")
-            raise
+                return [torch.zeros(default_seq_len, 1, default_hidden_dim) for _ in speech_arrays]
+            
+            # 直接按 (batch, seq, layers, dim) 堆叠得到连续张量，无需再转置拷贝
+            audio_emb = torch.stack(embeddings.hidden_states[1:], dim=2)
+            if use_autocast:
+                # MultiTalk管道最终以BF16(param_dtype)使用embedding，直接以BF16保存减少磁盘IO
+                audio_emb = audio_emb.to(torch.bfloat16)
+            
+            # 每个embedding拷贝到独立的连续CPU张量，torch.save时不会连带整个batch；
+            # GPU上使用锁页内存异步拷贝，全部提交后只同步一次
+            results = []
+            for emb in audio_emb:
+                out = torch.empty(emb.shape, dtype=emb.dtype, pin_memory=on_cuda)
+                out.copy_(emb, non_blocking=on_cuda)
+                results.append(out)
+            if on_cuda:
+                torch.cuda.current_stream(audio_emb.device).synchronize()
+            return results
     
     def generate_video(self, person1_image, person2_image, dialogue_script, 
                       prompt_text, voice1_path, voice2_path, 
                       sampling_steps=8, seed=42, text_guide_scale=5.0, 
                       audio_guide_scale=4.0, negative_prompt=""):
         """生成双人对话视频"""
+        input_data, generate_kwargs = self.prepare_generation(
+            person1_image, person2_image, dialogue_script, prompt_text,
+            voice1_path, voice2_path, sampling_steps=sampling_steps, seed=seed,
+            text_guide_scale=text_guide_scale, audio_guide_scale=audio_guide_scale,
+            negative_prompt=negative_prompt
+        )
+        return self.render_video(input_data, generate_kwargs)
+    
+    @torch.inference_mode()
+    def prepare_generation(self, person1_image, person2_image, dialogue_script,
+                           prompt_text, voice1_path, voice2_path,
+                           sampling_steps=8, seed=42, text_guide_scale=5.0,
+                           audio_guide_scale=4.0, negative_prompt=""):
+        """准备生成输入：解析脚本、合成图像、TTS与音频embedding
+        
+        只在rank 0上执行，可与上一个任务的render_video并行。
+        
+        Returns:
+            tuple: (input_data, generate_kwargs)，直接传给render_video
+        """
         try:
-            logging.info("开始生成视频...")
+            logging.info("开始准备生成输入...")
             
             # 1. 解析对话脚本
             formatted_dialogue = self.dialogue_parser.parse_dialogue(dialogue_script)
             logging.info(f"解析后的对话: {formatted_dialogue}")
             
             # 2. 创建合成图像
-            composite_image_path, bbox_info = self.create_composite_image(
+            composite_image, bbox_info = self.create_composite_image(
                 person1_image, person2_image
             )
             
@@ -396,55 +746,69 @@ class DistributedMultiTalkGenerator:
             
             # 4. 获取音频embeddings
             logging.info("正在提取音频特征...")
-            audio_embedding_1 = self.get_audio_embedding(s1_audio)
-            audio_embedding_2 = self.get_audio_embedding(s2_audio)
+            audio_embedding_1, audio_embedding_2 = self.get_audio_embeddings_batched(
+                [s1_audio, s2_audio]
+            )
             
-            # 保存embeddings
-            emb1_path = Path(audio_dir) / '1.pt'
-            emb2_path = Path(audio_dir) / '2.pt'
-            torch.save(audio_embedding_1, emb1_path)
-            torch.save(audio_embedding_2, emb2_path)
+            # 保存embeddings（后台写盘，render_video生成视频前等待完成）
+            emb1_path = os.path.join(audio_dir, '1.pt')
+            emb2_path = os.path.join(audio_dir, '2.pt')
+            self._pending_saves[emb1_path] = self._io_pool.submit(torch.save, audio_embedding_1, emb1_path)
+            self._pending_saves[emb2_path] = self._io_pool.submit(torch.save, audio_embedding_2, emb2_path)
             
             # 5. 构建输入数据
             input_data = {
                 "prompt": prompt_text,
-                "cond_image": composite_image_path,
+                "cond_image": composite_image,
                 "audio_type": "para",  # 并行音频模式
                 "cond_audio": {
-                    "person1": str(emb1_path),
-                    "person2": str(emb2_path)
+                    "person1": emb1_path,
+                    "person2": emb2_path
                 },
                 "video_audio": sum_audio_path,
                 "bbox": bbox_info
             }
             
+            # 随机种子在rank 0确定后随任务广播，保证各rank采样相同的初始噪声
+            seed = int(seed)
+            if seed < 0:
+                seed = random.randint(0, 99999999)
+            generate_kwargs = {
+                "sampling_steps": sampling_steps,
+                "text_guide_scale": text_guide_scale,
+                "audio_guide_scale": audio_guide_scale,
+                "seed": seed,
+                "n_prompt": negative_prompt,
+            }
+            return input_data, generate_kwargs
+            
+        except Exception as e:
+            logging.error(f"准备生成输入时发生错误: {e}")
+            raise
+    
+    def render_video(self, input_data, generate_kwargs):
+        """执行MultiTalk管道生成视频并保存，返回视频路径"""
+        try:
+            # 等待prepare_generation中后台写盘的embedding完成，管道从这些路径读取
+            for emb_path in input_data["cond_audio"].values():
+                future = self._pending_saves.pop(emb_path, None)
+                if future is not None:
+                    future.result()
+            
             # 6. 生成视频
+            if self.world_size > 1:
+                # 通知其他rank以相同输入参与本次生成
+                self._broadcast_task(input_data, generate_kwargs)
             logging.info("正在使用MultiTalk管道生成视频...")
-            video = self.wan_pipeline.generate(
-                input_data,
-                size_buckget="multitalk-720",  # 使用720P分辨率
-                motion_frame=self.args.motion_frame,
-                frame_num=self.args.frame_num,
-                shift=self.args.sample_shift,
-                sampling_steps=sampling_steps,
-                text_guide_scale=text_guide_scale,
-                audio_guide_scale=audio_guide_scale,
-                seed=seed,
-                n_prompt=negative_prompt,
-                offload_model=self.args.offload_model,
-                max_frames_num=self.args.frame_num,
-                color_correction_strength=self.args.color_correction_strength,
-                extra_args=self.args,
-            )
+            video = self._run_pipeline(input_data, generate_kwargs)
             
             # 7. 保存视频
-            from datetime import datetime
             formatted_time = datetime.now().strftime("%Y%m%d_%H%M%S")
             video_filename = f"distributed_multitalk_720p_{formatted_time}"
             
             logging.info(f"正在保存生成的视频: {video_filename}.mp4")
             save_video_ffmpeg(
-                video, video_filename, [sum_audio_path], high_quality_save=True
+                video, video_filename, [input_data["video_audio"]], high_quality_save=True
             )
             
             video_path = f"{video_filename}.mp4"
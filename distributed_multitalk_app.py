@@ -170,10 +170,8 @@ def main():
         try:
             generator = DistributedMultiTalkGenerator(args)
             print(f"✅ 进程 {rank} 分布式生成器初始化完成")
-            # 保持进程运行，等待分布式任务
-            import time
-            while True:
-                time.sleep(1)
+            # 等待主进程分发生成任务并协同执行
+            generator.run_worker_loop()
         except KeyboardInterrupt:
             print(f"\n🔚 进程 {rank} 已关闭")
         except Exception as e:
@@ -214,20 +212,21 @@ def main():
             print(f"📝 建议使用以下命令重新启动:")
             
             # 构建建议的启动命令
-            if hasattr(args, 'ulysses_size') and args.ulysses_size > 1:
+            # 未指定ulysses_size时由生成器按world_size自动划分
+            ulysses_size = args.ulysses_size if args.ulysses_size is not None else max(world_size // args.ring_size, 1)
+            if ulysses_size > 1:
                 cmd_parts = [
                     "torchrun",
-                    f"--nproc_per_node={args.ulysses_size}",
+                    f"--nproc_per_node={ulysses_size}",
                     "--master_port=29500",
                     "distributed_multitalk_app.py",
-                    f"--ulysses_size={args.ulysses_size}",
-                    f"--ring_size={args.ring_size}"
                 ]
+                if args.ulysses_size is not None:
+                    cmd_parts.append(f"--ulysses_size={args.ulysses_size}")
+                cmd_parts.append(f"--ring_size={args.ring_size}")
                 
-                if args.t5_fsdp:
-                    cmd_parts.append("--t5_fsdp")
-                if args.dit_fsdp:
-                    cmd_parts.append("--dit_fsdp")
+                cmd_parts.append("--t5_fsdp" if args.t5_fsdp else "--no-t5_fsdp")
+                cmd_parts.append("--dit_fsdp" if args.dit_fsdp else "--no-dit_fsdp")
                     
                 cmd_parts.append(f"--server_port={available_port}")
                 
@@ -265,13 +264,14 @@ def main():
     print(f"- 任务类型: {args.task}")
     print(f"- 视频分辨率: {args.size}")
     print(f"- 帧数: {args.frame_num}")
-    print(f"- Ulysses并行度: {args.ulysses_size}")
+    print(f"- Ulysses并行度: {args.ulysses_size or '自动'}")
     print(f"- Ring并行度: {args.ring_size}")
     print(f"- T5 FSDP: {args.t5_fsdp}")
     print(f"- DiT FSDP: {args.dit_fsdp}")
     print(f"- 服务端口: {args.server_port}")
     print("=" * 60)
     
+    generator = None
     try:
         # 创建分布式生成器
         print("正在初始化分布式生成器...")
@@ -317,6 +317,9 @@ def main():
         sys.exit(1)
         
     finally:
+        if generator is not None:
+            # 通知其他rank退出任务循环
+            generator.shutdown_workers()
         print("🔚 服务已关闭")
 
 
@@ -337,7 +340,7 @@ def validate_environment():
         
         missing_dirs = []
         for dir_path in required_dirs:
-            if not Path(dir_path).exists():
+            if not os.path.isdir(dir_path):
                 missing_dirs.append(dir_path)
         
         if missing_dirs:
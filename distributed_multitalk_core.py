@@ -1,56 +1,46 @@
 # Copyright 2024-2025 The Alibaba Wan Team Authors. All rights reserved.
 import argparse
-import logging
 import os
 os.environ["no_proxy"] = "localhost,127.0.0.1,::1"
-import sys
-import json
 import warnings
-from datetime import datetime
 import re
-import tempfile
-import uuid
-from pathlib import Path
+from itertools import cycle
 
-import gradio as gr
 warnings.filterwarnings('ignore')
 
-import random
-import torch
-import torch.distributed as dist
-from PIL import Image
-import subprocess
 
-import wan
-from wan.configs import SIZE_CONFIGS, SUPPORTED_SIZES, WAN_CONFIGS
-from wan.utils.utils import cache_image, cache_video, str2bool
-from wan.utils.multitalk_utils import save_video_ffmpeg
-from kokoro import KPipeline
-from transformers import Wav2Vec2FeatureExtractor
-from src.audio_analysis.wav2vec2 import Wav2Vec2Model
-
-import librosa
-import pyloudnorm as pyln
-import numpy as np
-from einops import rearrange
-import soundfile as sf
+def str2bool(v):
+    """与wan.utils.utils.str2bool一致；在此本地定义，导入本模块时不经过wan/__init__.py加载torch等依赖"""
+    if isinstance(v, bool):
+        return v
+    v_lower = v.lower()
+    if v_lower in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v_lower in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError('Boolean value expected (True/False)')
 
 
 class DialogueScriptParser:
     """解析对话台词脚本的类"""
     
+    # A/B格式的角色映射
+    _SPEAKER_LETTERS = {"A": "1", "B": "2"}
+    
     def __init__(self):
-        # 支持多种对话格式
-        self.patterns = [
+        # 支持多种对话格式，每种格式一个预编译正则；按字典顺序确定优先级，
+        # 第一个有匹配的格式决定整段脚本的切分方式，台词中出现的其他格式标记（如"Plan B:"）保留为正文
+        self.patterns = {
             # 格式: (s1) 台词 (s2) 台词
-            r'\(s(\d+)\)\s*(.*?)(?=\s*\(s\d+\)|$)',
+            "s": re.compile(r'\(s(\d+)\)\s*(.*?)(?=\s*\(s\d+\)|$)', re.DOTALL),
             # 格式: 角色1: 台词 角色2: 台词
-            r'角色(\d+)[:：]\s*(.*?)(?=\s*角色\d+[:：]|$)',
+            "role": re.compile(r'角色(\d+)[:：]\s*(.*?)(?=\s*角色\d+[:：]|$)', re.DOTALL),
             # 格式: 人物1: 台词 人物2: 台词
-            r'人物(\d+)[:：]\s*(.*?)(?=\s*人物\d+[:：]|$)',
+            "person": re.compile(r'人物(\d+)[:：]\s*(.*?)(?=\s*人物\d+[:：]|$)', re.DOTALL),
             # 格式: A: 台词 B: 台词 (将A映射为1，B映射为2)
-            r'([AB])[:：]\s*(.*?)(?=\s*[AB][:：]|$)',
-        ]
+            "ab": re.compile(r'([AB])[:：]\s*(.*?)(?=\s*[AB][:：]|$)', re.DOTALL),
+        }
     
     def parse_dialogue(self, script_text):
         """
@@ -64,49 +54,37 @@ class DialogueScriptParser:
         """
         script_text = script_text.strip()
         
-        # 尝试不同的解析模式
-        for i, pattern in enumerate(self.patterns):
-            matches = re.findall(pattern, script_text, re.DOTALL)
-            if matches:
-                return self._format_dialogue(matches, pattern_index=i)
+        # 按优先级尝试不同的解析模式
+        for dialogue_format, pattern in self.patterns.items():
+            matched = False
+            formatted_dialogue = []
+            # 边匹配边格式化，不构造中间的 (说话人, 台词) 列表
+            for match in pattern.finditer(script_text):
+                matched = True
+                speaker_id, content = match.group(1), match.group(2).strip()
+                if not content:
+                    continue
+                if dialogue_format == "ab":
+                    speaker_id = self._SPEAKER_LETTERS[speaker_id]
+                formatted_dialogue.append(f"(s{speaker_id}) {content}")
+            if matched:
+                return " ".join(formatted_dialogue)
         
         # 如果没有匹配到任何模式，按行分割并交替分配
         return self._parse_by_lines(script_text)
     
-    def _format_dialogue(self, matches, pattern_index):
-        """格式化匹配到的对话内容"""
-        formatted_dialogue = []
-        
-        for match in matches:
-            if pattern_index == 3:  # A/B格式
-                speaker_letter, content = match
-                speaker_id = "1" if speaker_letter == "A" else "2"
-            else:
-                speaker_id, content = match
-            
-            content = content.strip()
-            if content:
-                formatted_dialogue.append(f"(s{speaker_id}) {content}")
-        
-        return " ".join(formatted_dialogue)
-    
     def _parse_by_lines(self, script_text):
         """按行分割并交替分配给两个角色"""
-        lines = [line.strip() for line in script_text.split('\n') if line.strip()]
+        lines = [line for line in map(str.strip, script_text.splitlines()) if line]
         
         if not lines:
             return "(s1) 你好！ (s2) 很高兴见到你！"
         
-        formatted_dialogue = []
-        for i, line in enumerate(lines):
-            speaker_id = (i % 2) + 1
-            formatted_dialogue.append(f"(s{speaker_id}) {line}")
-        
-        return " ".join(formatted_dialogue)
+        return " ".join([f"(s{speaker_id}) {line}" for speaker_id, line in zip(cycle("12"), lines)])
 
 
-def _parse_args():
-    """解析命令行参数"""
+def _parse_args(argv=None):
+    """解析命令行参数，argv为None时读取sys.argv"""
     parser = argparse.ArgumentParser(
         description="Distributed MultiTalk Web Service for Dual-Person Dialogue Video Generation"
     )
@@ -118,25 +96,46 @@ def _parse_args():
     parser.add_argument("--ckpt_dir", type=str, default='./weights/Wan2.1-I2V-14B-720P', 
                        help="Path to checkpoint directory.")
     parser.add_argument("--quant_dir", type=str, default=None, help="Path to quantized checkpoint directory.")
+    parser.add_argument("--ckpt_cache_dir", type=str, default=None,
+                       help="Mirror ckpt_dir into this directory (e.g. /dev/shm) and load from there, "
+                            "so restarts skip the disk read.")
     parser.add_argument("--wav2vec_dir", type=str, default='./weights/chinese-wav2vec2-base',
                        help="Path to wav2vec checkpoint directory.")
+    parser.add_argument("--wav2vec_fp32", action="store_true", default=False,
+                       help="Keep the wav2vec encoder weights in FP32 instead of BF16.")
     parser.add_argument("--lora_dir", type=str, nargs='+', default=None, help="Path to LoRA checkpoint.")
     parser.add_argument("--lora_scale", type=float, nargs='+', default=[1.2], help="LoRA scale factors.")
     
     # 分布式参数
-    parser.add_argument("--ulysses_size", type=int, default=8, help="Ulysses parallelism size.")
+    parser.add_argument("--ulysses_size", type=int, default=None,
+                       help="Ulysses parallelism size. Defaults to world_size // ring_size, "
+                            "falling back to Ring x Ulysses (USP) when num_heads is not divisible.")
     parser.add_argument("--ring_size", type=int, default=1, help="Ring attention parallelism size.")
-    parser.add_argument("--t5_fsdp", action="store_true", default=True, help="Use FSDP for T5.")
-    parser.add_argument("--dit_fsdp", action="store_true", default=True, help="Use FSDP for DiT.")
+    parser.add_argument("--t5_fsdp", action=argparse.BooleanOptionalAction, default=True,
+                       help="Use FSDP for T5 (disable with --no-t5_fsdp).")
+    parser.add_argument("--dit_fsdp", action=argparse.BooleanOptionalAction, default=True,
+                       help="Use FSDP for DiT (disable with --no-dit_fsdp).")
     parser.add_argument("--t5_cpu", action="store_true", default=False, help="Place T5 model on CPU.")
     parser.add_argument("--offload_model", type=str2bool, default=None, help="Offload model to CPU.")
+    parser.add_argument("--offload_type", type=str, default="model", choices=["model", "block_level"],
+                       help="DiT offload granularity: whole model, or groups of transformer blocks.")
+    parser.add_argument("--num_blocks_per_group", type=int, default=1,
+                       help="Transformer blocks moved together when offload_type is block_level.")
+    parser.add_argument("--use_stream", type=str2bool, default=True,
+                       help="Prefetch the next block group on a separate CUDA stream.")
     
     # 生成参数
     parser.add_argument("--motion_frame", type=int, default=25, help="Motion frame length.")
     parser.add_argument("--sample_shift", type=float, default=11, help="Sample shift for 720P.")
     parser.add_argument("--color_correction_strength", type=float, default=1.0, help="Color correction strength.")
     parser.add_argument("--base_seed", type=int, default=42, help="Base seed for generation.")
-    parser.add_argument("--quant", type=str, default=None, help="Quantization type.")
+    parser.add_argument("--quant", type=str, default=None, choices=["int8", "fp8"],
+                       help="Quantization type. Defaults to fp8 on a single GPU without --lora_dir "
+                            "when --quant_dir contains a pre-quantized fp8 DiT.")
+    parser.add_argument("--compile", action="store_true", default=False,
+                       help="Compile the DiT transformer blocks with torch.compile.")
+    parser.add_argument("--compile_mode", type=str, default="max-autotune",
+                       help="torch.compile mode used with --compile.")
     
     # 其他参数
     parser.add_argument("--audio_save_dir", type=str, default='save_audio/distributed',
@@ -145,7 +144,7 @@ def _parse_args():
                        help="Maximum parameter quantity retained in VRAM.")
     parser.add_argument("--server_port", type=int, default=8419, help="Web server port.")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # 验证参数
     assert args.task == "multitalk-14B", 'You should choose multitalk-14B in args.task.'
@@ -157,4 +156,4 @@ def _parse_args():
 if __name__ == "__main__":
     args = _parse_args()
     print("分布式MultiTalk Web服务启动中...")
-    print(f"配置: 任务={args.task}, 分辨率={args.size}, Ulysses并行度={args.ulysses_size}")
\ No newline at end of file
+    print(f"配置: 任务={args.task}, 分辨率={args.size}, Ulysses并行度={args.ulysses_size or '自动'}")
\ No newline at end of file
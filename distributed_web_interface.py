@@ -1,58 +1,83 @@
 import gradio as gr
 import logging
+import threading
+from types import MappingProxyType
 from distributed_generator import DistributedMultiTalkGenerator
 
 
+# 语音模型路径映射（只读，所有请求共享）
+_VOICE_MAPPING = MappingProxyType({
+    "女性温柔": "weights/Kokoro-82M/voices/af_heart.pt",
+    "男性成熟": "weights/Kokoro-82M/voices/am_adam.pt",
+    "女性活泼": "weights/Kokoro-82M/voices/af_bella.pt",
+    "男性年轻": "weights/Kokoro-82M/voices/am_freeman.pt",
+})
+
+# 请求队列配置：排队上限与默认并发数（所有rank协同执行同一任务，同一时间只运行一个）
+_QUEUE_MAX_SIZE = 10
+_QUEUE_CONCURRENCY_LIMIT = 1
+# 生成事件的并发数：一个请求渲染视频的同时，允许下一个请求准备输入
+_GENERATE_CONCURRENCY_LIMIT = 2
+
+
 def create_gradio_interface(generator):
     """创建Gradio Web界面"""
     
-    def generate_video_wrapper(person1_image, person2_image, dialogue_script, 
-                             prompt_text, voice1_choice, voice2_choice,
-                             sampling_steps, seed, text_guide_scale, audio_guide_scale,
-                             negative_prompt):
-        """Web界面的视频生成包装函数"""
+    generator.preload_voices(_VOICE_MAPPING.values())
+    
+    # 准备阶段（rank 0上的TTS/embedding）与渲染阶段（所有rank协同运行DiT）各自同一时间只运行一个，
+    # 两个阶段之间可以重叠；准备结果保存在每次调用的局部变量中，不同点击互不覆盖
+    prepare_lock = threading.Lock()
+    render_lock = threading.Lock()
+    
+    def generate_wrapper(person1_image, person2_image, dialogue_script, 
+                         prompt_text, voice1_choice, voice2_choice,
+                         sampling_steps, seed, text_guide_scale, audio_guide_scale,
+                         negative_prompt):
+        """校验输入，准备TTS音频、embedding与合成图像，再多卡协同生成视频，输出 (视频路径, 状态)"""
+        voice1_path = _VOICE_MAPPING.get(voice1_choice, _VOICE_MAPPING["女性温柔"])
+        voice2_path = _VOICE_MAPPING.get(voice2_choice, _VOICE_MAPPING["男性成熟"])
+        
+        if not person1_image or not person2_image:
+            yield None, "错误：请上传两个人物图片"
+            return
+        
+        if not dialogue_script.strip():
+            yield None, "错误：请输入对话台词"
+            return
+        
+        if not prompt_text.strip():
+            yield None, "错误：请输入场景描述"
+            return
+        
+        yield None, "正在生成语音和合成图像..."
         try:
-            # 语音模型路径映射
-            voice_mapping = {
-                "女性温柔": "weights/Kokoro-82M/voices/af_heart.pt",
-                "男性成熟": "weights/Kokoro-82M/voices/am_adam.pt",
-                "女性活泼": "weights/Kokoro-82M/voices/af_bella.pt",
-                "男性年轻": "weights/Kokoro-82M/voices/am_freeman.pt",
-            }
-            
-            voice1_path = voice_mapping.get(voice1_choice, voice_mapping["女性温柔"])
-            voice2_path = voice_mapping.get(voice2_choice, voice_mapping["男性成熟"])
-            
-            if not person1_image or not person2_image:
-                return "错误：请上传两个人物图片"
-            
-            if not dialogue_script.strip():
-                return "错误：请输入对话台词"
-            
-            if not prompt_text.strip():
-                return "错误：请输入场景描述"
-            
-            # 生成视频
-            video_path = generator.generate_video(
-                person1_image=person1_image,
-                person2_image=person2_image,
-                dialogue_script=dialogue_script,
-                prompt_text=prompt_text,
-                voice1_path=voice1_path,
-                voice2_path=voice2_path,
-                sampling_steps=sampling_steps,
-                seed=seed,
-                text_guide_scale=text_guide_scale,
-                audio_guide_scale=audio_guide_scale,
-                negative_prompt=negative_prompt
-            )
-            
-            return video_path
+            with prepare_lock:
+                prepared = generator.prepare_generation(
+                    person1_image=person1_image,
+                    person2_image=person2_image,
+                    dialogue_script=dialogue_script,
+                    prompt_text=prompt_text,
+                    voice1_path=voice1_path,
+                    voice2_path=voice2_path,
+                    sampling_steps=sampling_steps,
+                    seed=seed,
+                    text_guide_scale=text_guide_scale,
+                    audio_guide_scale=audio_guide_scale,
+                    negative_prompt=negative_prompt
+                )
             
+            yield None, "输入准备完成，等待GPU生成视频..."
+            # 所有rank协同执行同一任务，同一时间只能运行一个生成
+            with render_lock:
+                video_path = generator.render_video(*prepared)
         except Exception as e:
             error_msg = f"生成视频时发生错误: {str(e)}"
             logging.error(error_msg)
-            return error_msg
+            yield None, error_msg
+            return
+        
+        yield video_path, "视频生成完成"
     
     # 创建Gradio界面
     with gr.Blocks(title="分布式MultiTalk双人对话视频生成") as demo:
@@ -226,24 +251,18 @@ def create_gradio_interface(generator):
                     - 720P生成需要较长时间，请耐心等待
                     """)
 
-        # 绑定生成事件
+        # 绑定生成事件：两个请求可以同时处理，由generate_wrapper中的锁
+        # 保证一个请求渲染视频时至多另一个请求在准备输入
         generate_button.click(
-            fn=generate_video_wrapper,
+            fn=generate_wrapper,
             inputs=[
                 person1_image, person2_image, dialogue_script, prompt_text,
                 voice1_choice, voice2_choice, sampling_steps, seed,
                 text_guide_scale, audio_guide_scale, negative_prompt
             ],
-            outputs=[result_video],
-        )
-        
-        # 实时状态更新
-        def update_status():
-            return "正在生成中，请稍候..."
-        
-        generate_button.click(
-            fn=update_status,
-            outputs=[status_text]
+            outputs=[result_video, status_text],
+            concurrency_limit=_GENERATE_CONCURRENCY_LIMIT,
         )
     
+    demo.queue(max_size=_QUEUE_MAX_SIZE, default_concurrency_limit=_QUEUE_CONCURRENCY_LIMIT)
     return demo
\ No newline at end of file
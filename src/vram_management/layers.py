@@ -1,4 +1,5 @@
 import copy
+import functools
 
 import torch
 
@@ -269,3 +270,78 @@ def enable_vram_management(
         total_num_param=0,
     )
     model.vram_management_enabled = True
+
+
+class BlockGroupOffloader:
+    """
+    按block分组将DiT权重常驻在CPU锁页内存中，前向时分组搬运到GPU，
+    使用独立的CUDA流在当前组计算的同时预取下一组权重
+    """
+
+    def __init__(self, blocks, device, num_blocks_per_group=1, use_stream=True):
+        self.device = torch.device(device)
+        self.groups = [
+            list(blocks[i:i + num_blocks_per_group])
+            for i in range(0, len(blocks), num_blocks_per_group)
+        ]
+        # 每组的 (张量, CPU锁页副本)；推理期间权重只读，卸载时直接丢弃GPU副本即可
+        self.tensors = []
+        for group in self.groups:
+            tensors = []
+            for block in group:
+                for t in list(block.parameters()) + list(block.buffers()):
+                    t.data = t.data.cpu().pin_memory()
+                    tensors.append((t, t.data))
+            self.tensors.append(tensors)
+        self.stream = torch.cuda.Stream(self.device) if use_stream else None
+        self.events = [None] * len(self.groups)
+        self.loaded = [False] * len(self.groups)
+
+        for index, group in enumerate(self.groups):
+            group[0].register_forward_pre_hook(functools.partial(self._pre_forward, index))
+            group[-1].register_forward_hook(functools.partial(self._post_forward, index))
+
+    def _onload(self, index):
+        if self.loaded[index]:
+            return
+        if self.stream is None:
+            for t, cpu_data in self.tensors[index]:
+                t.data = cpu_data.to(self.device)
+        else:
+            with torch.cuda.stream(self.stream):
+                for t, cpu_data in self.tensors[index]:
+                    t.data = cpu_data.to(self.device, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record(self.stream)
+            self.events[index] = event
+        self.loaded[index] = True
+
+    def _pre_forward(self, index, module, args):
+        self._onload(index)
+        event = self.events[index]
+        if event is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(event)
+            # 权重在传输流上分配，需告知分配器其在计算流上被使用
+            for t, _ in self.tensors[index]:
+                t.data.record_stream(current_stream)
+            self.events[index] = None
+        if self.stream is not None:
+            # 循环预取：最后一组计算时预取第一组，供下一次前向使用
+            self._onload((index + 1) % len(self.groups))
+
+    def _post_forward(self, index, module, args, output):
+        if len(self.groups) > 1:
+            for t, cpu_data in self.tensors[index]:
+                t.data = cpu_data
+            self.loaded[index] = False
+
+
+def enable_block_offload(model: torch.nn.Module, device, num_blocks_per_group=1, use_stream=True):
+    offloader = BlockGroupOffloader(model.blocks, device, num_blocks_per_group, use_stream)
+    # blocks之外的嵌入层与输出头体积很小，常驻GPU
+    for name, module in model.named_children():
+        if name != "blocks":
+            module.to(device)
+    model.block_offloader = offloader
+    return offloader
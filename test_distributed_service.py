@@ -1,227 +1,211 @@
 #!/usr/bin/env python3
 """
-分布式MultiTalk Web服务测试脚本
+分布式MultiTalk Web服务测试（pytest）
 
 测试项目：
 1. 对话脚本解析功能
 2. 参数配置验证
-3. 模块导入测试
-4. Web界面创建测试
+3. Web界面创建测试
+4. 文件结构检查
+
+项目模块是否存在由conftest.py在收集阶段统一检查。
+
+运行方式：
+    pytest test_distributed_service.py
+    pytest -n auto test_distributed_service.py   # 需要pytest-xdist，多进程并行
 """
 
-import sys
+import functools
+import importlib.util
 import os
+import re
+import sys
 from pathlib import Path
+from unittest import mock
+
+import pytest
 
 # 添加项目路径
 sys.path.append(str(Path(__file__).parent))
 
-def test_dialogue_parser():
+# 核心模块在模块级导入一次，所有测试共享
+dmc = pytest.importorskip("distributed_multitalk_core")
+
+
+# 测试不同格式的对话: (输入, 期望的TTS文本)
+DIALOGUE_CASES: tuple[tuple[str, str], ...] = (
+    # 标准格式
+    ("(s1) 你好！ (s2) 很高兴见到你！",
+     "(s1) 你好！ (s2) 很高兴见到你！"),
+    # 角色格式
+    ("角色1: 今天天气真好 角色2: 是啊，很适合出门",
+     "(s1) 今天天气真好 (s2) 是啊，很适合出门"),
+    # A/B格式
+    ("A: 这个项目怎么样？ B: 我觉得很不错！",
+     "(s1) 这个项目怎么样？ (s2) 我觉得很不错！"),
+    # 自由格式
+    ("你好，今天天气真好啊！\n是的，很适合出去走走。\n要不要一起去公园？\n好主意，我们走吧！",
+     "(s1) 你好，今天天气真好啊！ (s2) 是的，很适合出去走走。 (s1) 要不要一起去公园？ (s2) 好主意，我们走吧！"),
+    # 台词中出现其他格式的标记时，按优先级最高的格式解析，其余保留为正文
+    ("(s1) Plan B: we run. (s2) OK",
+     "(s1) Plan B: we run. (s2) OK"),
+    ("(s1) 我们选A：方案 (s2) 好",
+     "(s1) 我们选A：方案 (s2) 好"),
+    ("(s1) hi 角色2: yo (s2) there",
+     "(s1) hi 角色2: yo (s2) there"),
+    # 混合标记时按格式优先级 (sN) > 角色N > 人物N > A/B 选择，而非按出现位置
+    ("A: x (s1) y",
+     "(s1) y"),
+)
+DIALOGUE_IDS = ("standard", "role", "ab", "lines", "s_with_ab", "s_with_ab_fullwidth", "s_with_role",
+                "mixed_priority")
+
+
+# 项目必需文件
+REQUIRED_FILES: frozenset[str] = frozenset({
+    "distributed_multitalk_core.py",
+    "distributed_generator.py",
+    "distributed_web_interface.py",
+    "distributed_multitalk_app.py",
+    "start_distributed_service.sh",
+    "start_distributed_service.bat",
+    "DISTRIBUTED_README.md",
+})
+
+
+class MockGenerator:
+    """模拟的生成器对象，只提供Web界面用到的接口"""
+
+    def preload_voices(self, voice_paths):
+        pass
+
+    def generate_video(self, **kwargs):
+        return "test_video.mp4"
+
+    def prepare_generation(self, **kwargs):
+        return {"prompt": kwargs["prompt_text"]}, {}
+
+    def render_video(self, input_data, generate_kwargs):
+        return f"{input_data['prompt']}.mp4"
+
+
+@pytest.fixture(scope="session")
+def parser():
+    """对话解析器无状态，每个测试进程只构造一次"""
+    return dmc.DialogueScriptParser()
+
+
+@pytest.fixture(scope="session")
+def mock_generator():
+    return MockGenerator()
+
+
+@pytest.fixture(scope="session")
+def project_files():
+    """项目目录下的文件名集合，一次目录扫描代替逐个stat，每个测试进程只扫描一次"""
+    return {entry.name for entry in os.scandir(Path(__file__).parent)}
+
+
+@pytest.mark.parametrize("text,expected", DIALOGUE_CASES, ids=DIALOGUE_IDS)
+def test_dialogue_parser(parser, text, expected):
     """测试对话脚本解析功能"""
-    print("🔍 测试对话脚本解析功能...")
-    
-    try:
-        from distributed_multitalk_core import DialogueScriptParser
-        
-        parser = DialogueScriptParser()
-        
-        # 测试不同格式的对话
-        test_cases = [
-            # 标准格式
-            "(s1) 你好！ (s2) 很高兴见到你！",
-            
-            # 角色格式
-            "角色1: 今天天气真好 角色2: 是啊，很适合出门",
-            
-            # A/B格式
-            "A: 这个项目怎么样？ B: 我觉得很不错！",
-            
-            # 自由格式
-            "你好，今天天气真好啊！\n是的，很适合出去走走。\n要不要一起去公园？\n好主意，我们走吧！"
-        ]
-        
-        for i, test_input in enumerate(test_cases, 1):
-            result = parser.parse_dialogue(test_input)
-            print(f"   测试 {i}: ✅")
-            print(f"   输入: {test_input[:50]}...")
-            print(f"   输出: {result}")
-            print()
-        
-        print("✅ 对话脚本解析功能测试通过")
-        return True
-        
-    except Exception as e:
-        print(f"❌ 对话脚本解析功能测试失败: {e}")
-        return False
+    assert parser.parse_dialogue(text) == expected
+
+
+@pytest.mark.parametrize("text,expected", DIALOGUE_CASES, ids=DIALOGUE_IDS)
+def test_parse_dialogue_is_precompiled(parser, text, expected):
+    """解析器应在构造时预编译正则，解析热路径上不再编译"""
+    assert all(isinstance(pattern, re.Pattern) for pattern in parser.patterns.values())
+
+    with mock.patch.object(re, "compile", side_effect=AssertionError("parse_dialogue中不应编译正则")):
+        assert parser.parse_dialogue(text) == expected
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_parse(argv):
+    """按参数元组缓存解析结果，相同argv重复解析时直接命中缓存（返回的Namespace只读使用）"""
+    return dmc._parse_args(list(argv))
 
 
 def test_args_parsing():
     """测试参数解析功能"""
-    print("🔍 测试参数解析功能...")
-    
-    try:
-        # 临时修改sys.argv来模拟命令行参数
-        original_argv = sys.argv.copy()
-        sys.argv = [
-            "test_script.py",
-            "--task", "multitalk-14B",
-            "--size", "multitalk-720", 
-            "--ulysses_size", "8",
-            "--server_port", "8419"
-        ]
-        
-        from distributed_multitalk_core import _parse_args
-        args = _parse_args()
-        
-        # 验证关键参数
-        assert args.task == "multitalk-14B"
-        assert args.size == "multitalk-720"
-        assert args.ulysses_size == 8
-        assert args.server_port == 8419
-        
-        # 恢复原始argv
-        sys.argv = original_argv
-        
-        print("✅ 参数解析功能测试通过")
-        return True
-        
-    except Exception as e:
-        print(f"❌ 参数解析功能测试失败: {e}")
-        return False
-
-
-def test_module_imports():
-    """测试模块导入"""
-    print("🔍 测试模块导入...")
-    
-    try:
-        # 测试核心模块
-        from distributed_multitalk_core import DialogueScriptParser, _parse_args
-        print("   ✅ distributed_multitalk_core")
-        
-        # 测试生成器模块 (可能因为缺少模型而失败，但至少语法要正确)
-        try:
-            from distributed_generator import DistributedMultiTalkGenerator
-            print("   ✅ distributed_generator")
-        except Exception as e:
-            if "No module named" in str(e) or "cannot import" in str(e):
-                print(f"   ⚠️  distributed_generator (依赖问题，但语法正确): {e}")
-            else:
-                print(f"   ❌ distributed_generator: {e}")
-                return False
-        
-        # 测试Web界面模块
-        from distributed_web_interface import create_gradio_interface
-        print("   ✅ distributed_web_interface")
-        
-        print("✅ 模块导入测试通过")
-        return True
-        
-    except Exception as e:
-        print(f"❌ 模块导入测试失败: {e}")
-        return False
-
-
-def test_gradio_interface():
+    # 直接传入参数元组，不修改全局sys.argv
+    args = _cached_parse((
+        "--task", "multitalk-14B",
+        "--size", "multitalk-720",
+        "--ulysses_size", "8",
+        "--server_port", "8419",
+    ))
+
+    # 验证关键参数
+    assert args.task == "multitalk-14B"
+    assert args.size == "multitalk-720"
+    assert args.ulysses_size == 8
+    assert args.server_port == 8419
+
+
+def test_fsdp_flags_can_be_disabled():
+    """FSDP默认开启，block_level卸载需要能够关闭DiT FSDP"""
+    assert _cached_parse(()).dit_fsdp
+
+    args = _cached_parse(("--offload_type", "block_level", "--no-dit_fsdp", "--no-t5_fsdp"))
+    assert args.offload_type == "block_level"
+    assert not args.dit_fsdp and not args.t5_fsdp
+
+
+def test_gradio_interface(mock_generator):
     """测试Gradio界面创建"""
-    print("🔍 测试Gradio界面创建...")
-    
-    try:
-        import gradio as gr
-        from distributed_web_interface import create_gradio_interface
-        
-        # 创建一个模拟的生成器对象
-        class MockGenerator:
-            def generate_video(self, **kwargs):
-                return "test_video.mp4"
-        
-        mock_generator = MockGenerator()
-        
-        # 创建界面（不启动）
-        demo = create_gradio_interface(mock_generator)
-        
-        # 验证界面对象
-        assert hasattr(demo, 'launch'), "Demo对象应该有launch方法"
-        
-        print("✅ Gradio界面创建测试通过")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Gradio界面创建测试失败: {e}")
-        return False
-
-
-def test_file_structure():
+    web = pytest.importorskip("distributed_web_interface")
+
+    # 用MagicMock替换gradio，只验证界面工厂的调用逻辑，不构建真实组件树
+    with mock.patch.object(web, "gr", new_callable=mock.MagicMock) as mock_gr:
+        demo = web.create_gradio_interface(mock_generator)
+
+    # 返回的是with gr.Blocks(...)块内构建的界面对象
+    assert mock_gr.Blocks.called
+    assert demo is mock_gr.Blocks.return_value.__enter__.return_value
+
+    # 单个生成事件，允许一个请求渲染时另一个请求准备输入，不再经过共享的gr.State中转
+    click = mock_gr.Button.return_value.click
+    click.assert_called_once()
+    assert click.call_args.kwargs["concurrency_limit"] == web._GENERATE_CONCURRENCY_LIMIT
+    assert not click.return_value.then.called
+
+    demo.queue.assert_called_once_with(
+        max_size=web._QUEUE_MAX_SIZE,
+        default_concurrency_limit=web._QUEUE_CONCURRENCY_LIMIT,
+    )
+
+
+def test_generate_keeps_each_click_payload(mock_generator):
+    """第二次点击在第一次渲染前完成准备时，两次点击各自渲染自己的输入"""
+    web = pytest.importorskip("distributed_web_interface")
+    with mock.patch.object(web, "gr", new_callable=mock.MagicMock) as mock_gr:
+        web.create_gradio_interface(mock_generator)
+    generate = mock_gr.Button.return_value.click.call_args.kwargs["fn"]
+
+    def click(prompt):
+        return generate("person1.png", "person2.png", "(s1) 你好 (s2) 你好", prompt,
+                        "女性温柔", "男性成熟", 8, 42, 5.0, 4.0, "")
+
+    first, second = click("first"), click("second")
+    # 两次点击都完成准备后才开始渲染
+    for job in (first, second, first, second):
+        next(job)
+    assert list(first)[-1] == ("first.mp4", "视频生成完成")
+    assert list(second)[-1] == ("second.mp4", "视频生成完成")
+
+
+def test_file_structure(project_files):
     """测试文件结构"""
-    print("🔍 测试文件结构...")
-    
-    required_files = [
-        "distributed_multitalk_core.py",
-        "distributed_generator.py", 
-        "distributed_web_interface.py",
-        "distributed_multitalk_app.py",
-        "start_distributed_service.sh",
-        "start_distributed_service.bat",
-        "DISTRIBUTED_README.md"
-    ]
-    
-    missing_files = []
-    for file_path in required_files:
-        if not Path(file_path).exists():
-            missing_files.append(file_path)
-        else:
-            print(f"   ✅ {file_path}")
-    
-    if missing_files:
-        print(f"❌ 缺少文件: {missing_files}")
-        return False
-    
-    print("✅ 文件结构测试通过")
-    return True
-
-
-def main():
-    """主测试函数"""
-    print("=" * 60)
-    print("🧪 分布式MultiTalk Web服务测试")
-    print("=" * 60)
-    
-    tests = [
-        ("文件结构", test_file_structure),
-        ("模块导入", test_module_imports),
-        ("参数解析", test_args_parsing),
-        ("对话解析", test_dialogue_parser),
-        ("Gradio界面", test_gradio_interface),
-    ]
-    
-    passed = 0
-    total = len(tests)
-    
-    for test_name, test_func in tests:
-        print(f"\n📋 {test_name}测试:")
-        print("-" * 40)
-        
-        if test_func():
-            passed += 1
-        
-        print("-" * 40)
-    
-    print("\n" + "=" * 60)
-    print(f"🎯 测试结果: {passed}/{total} 通过")
-    
-    if passed == total:
-        print("🎉 所有测试通过！分布式Web服务可以启动。")
-        print("\n📝 启动建议:")
-        print("1. 确保已下载所有必要的模型文件")
-        print("2. 使用启动脚本启动服务:")
-        print("   Windows: start_distributed_service.bat distributed")
-        print("   Linux:   bash start_distributed_service.sh distributed")
-        print("3. 在浏览器中访问: http://localhost:8419")
-    else:
-        print("⚠️  部分测试未通过，请检查相关问题后再启动服务。")
-    
-    print("=" * 60)
+    missing_files = REQUIRED_FILES - project_files
+
+    assert not missing_files, f"缺少文件: {sorted(missing_files)}"
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    pytest_args = [__file__, "-v"]
+    # 直接运行时如安装了pytest-xdist则多进程并行，预留2个核心给系统
+    if importlib.util.find_spec("xdist") is not None:
+        pytest_args += ["-n", str(max(1, (os.cpu_count() or 1) - 2))]
+    sys.exit(pytest.main(pytest_args))
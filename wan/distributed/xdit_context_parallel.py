@@ -17,6 +17,18 @@ from ..utils.multitalk_utils import get_attn_map_with_target, split_token_counts
 from ..modules.attention import SingleStreamAttention, SingleStreamMutiAttention
 
 
+_LONG_CTX_ATTENTION = None
+
+
+def get_long_ctx_attention():
+    # xFuserLongContextAttention is stateless once built; reuse one instance
+    # instead of constructing it for every block in every denoising step.
+    global _LONG_CTX_ATTENTION
+    if _LONG_CTX_ATTENTION is None:
+        _LONG_CTX_ATTENTION = xFuserLongContextAttention()
+    return _LONG_CTX_ATTENTION
+
+
 def pad_freqs(original_tensor, target_len):
     seq_len, s1, s2 = original_tensor.shape
     pad_size = target_len - seq_len
@@ -211,7 +223,7 @@ def usp_attn_forward(self,
     #     k = torch.cat([u[:l] for u, l in zip(k, k_lens)]).unsqueeze(0)
     #     v = torch.cat([u[:l] for u, l in zip(v, k_lens)]).unsqueeze(0)
 
-    x = xFuserLongContextAttention()(
+    x = get_long_ctx_attention()(
         None,
         query=half(q),
         key=half(k),
@@ -450,7 +462,7 @@ def usp_attn_forward_multitalk(self,
     k = rope_apply(k, grid_sizes, freqs)
 
 
-    x = xFuserLongContextAttention()(
+    x = get_long_ctx_attention()(
         None,
         query=half(q),
         key=half(k),
@@ -28,7 +28,7 @@ from .modules.multitalk_model import WanModel, WanLayerNorm, WanRMSNorm
 from .modules.t5 import T5EncoderModel, T5LayerNorm, T5RelativeEmbedding
 from .modules.vae import WanVAE, CausalConv3d, RMS_norm, Upsample
 from .utils.multitalk_utils import MomentumBuffer, adaptive_projected_guidance, match_and_blend_colors
-from src.vram_management import AutoWrappedQLinear, AutoWrappedLinear, AutoWrappedModule, enable_vram_management
+from src.vram_management import AutoWrappedQLinear, AutoWrappedLinear, AutoWrappedModule, enable_vram_management, enable_block_offload
 from wan.utils.utils import load_torch_file, standardize_lora_key_format, load_lora_for_models, apply_lora
 from wan.wan_lora import WanLoraWrapper
 
@@ -120,7 +120,8 @@ class MultiTalkPipeline:
         use_timestep_transform=True,
         lora_dir=None,
         lora_scales=None,
-        quant = None
+        quant = None,
+        block_offload=False,
     ):
         r"""
         Initializes the image-to-video generation model components.
@@ -146,6 +147,9 @@ class MultiTalkPipeline:
                 Enable initializing Transformer Model on CPU. Only works without FSDP or USP.
             quant (`str`, *optional*, defaults to None):
                 Quantization type, must be 'int8' or 'fp8'.
+            block_offload (`bool`, *optional*, defaults to False):
+                Keep the DiT on CPU after loading so that `enable_block_offload` can stream its blocks
+                to the GPU. Only works without dit_fsdp.
         """
         if quant is not None and quant not in ("int8", "fp8"):
             raise ValueError("quant must be 'int8', 'fp8', or None(default fp32 model)")
@@ -242,6 +246,9 @@ class MultiTalkPipeline:
             dist.barrier()
         if dit_fsdp:
             self.model = shard_fn(self.model)
+        elif block_offload:
+            # DiT留在CPU上，由enable_block_offload只把blocks以外的模块搬到GPU
+            pass
         else:
             if not init_on_cpu:
                 self.model.to(self.device)
@@ -300,6 +307,16 @@ class MultiTalkPipeline:
         )
         self.enable_cpu_offload()
 
+    def enable_block_offload(self, num_blocks_per_group=1, use_stream=True):
+        enable_block_offload(
+            self.model,
+            self.device,
+            num_blocks_per_group=num_blocks_per_group,
+            use_stream=use_stream,
+        )
+        # blocks的搬运由前向钩子负责，generate中不再整体移动DiT
+        self.vram_management = True
+
     def enable_cpu_offload(self):
         self.cpu_offload = True
     
@@ -359,7 +376,8 @@ class MultiTalkPipeline:
                  face_scale=0.05,
                  progress=True,
                  color_correction_strength=0.0,
-                 extra_args=None):
+                 extra_args=None,
+                 generator=None):
         r"""
         Generates video frames from input image and text prompt using diffusion process.
 
@@ -377,6 +395,9 @@ class MultiTalkPipeline:
                 Random seed for noise generation. If -1, use random seed
             offload_model (`bool`, *optional*, defaults to True):
                 If True, offloads models to CPU during generation to save VRAM
+            generator (`torch.Generator`, *optional*, defaults to None):
+                Reusable generator on the pipeline device for noise sampling. If given, it is
+                reseeded instead of the global torch/CUDA RNG states
         """
 
         # init teacache
@@ -390,8 +411,13 @@ class MultiTalkPipeline:
             self.model.disable_teacache()
 
         input_prompt = input_data['prompt']
-        cond_file_path = input_data['cond_image']
-        cond_image = Image.open(cond_file_path).convert('RGB')
+        # cond_image may be a file path, a PIL image or an HxWx3 uint8 array
+        cond_image = input_data['cond_image']
+        if isinstance(cond_image, np.ndarray):
+            cond_image = Image.fromarray(cond_image)
+        elif not isinstance(cond_image, Image.Image):
+            cond_image = Image.open(cond_image)
+        cond_image = cond_image.convert('RGB')
         
         
         # decide a proper size
@@ -470,8 +496,11 @@ class MultiTalkPipeline:
 
         # set random seed and init noise
         seed = seed if seed >= 0 else random.randint(0, 99999999)
-        torch.manual_seed(seed)
-        torch.cuda.manual_seed_all(seed)
+        if generator is None:
+            torch.manual_seed(seed)
+            torch.cuda.manual_seed_all(seed)
+        else:
+            generator.manual_seed(seed)
         np.random.seed(seed)
         random.seed(seed)
         torch.backends.cudnn.deterministic = True
@@ -507,7 +536,8 @@ class MultiTalkPipeline:
                 lat_h,
                 lat_w,
                 dtype=torch.float32,
-                device=self.device) 
+                device=self.device,
+                generator=generator) 
 
             # get mask
             msk = torch.ones(1, frame_num, lat_h, lat_w, device=self.device)
@@ -649,7 +679,9 @@ class MultiTalkPipeline:
                 # injecting motion frames
                 if not is_first_clip:
                     latent_motion_frames = latent_motion_frames.to(latent.dtype).to(self.device)
-                    motion_add_noise = torch.randn_like(latent_motion_frames).contiguous()
+                    motion_add_noise = torch.randn(
+                        latent_motion_frames.shape, dtype=latent_motion_frames.dtype,
+                        device=latent_motion_frames.device, generator=generator)
                     add_latent = self.add_noise(latent_motion_frames, motion_add_noise, timesteps[0])
                     _, T_m, _, _ = add_latent.shape
                     latent[:, :T_m] = add_latent
@@ -720,7 +752,9 @@ class MultiTalkPipeline:
                     # injecting motion frames
                     if not is_first_clip:
                         latent_motion_frames = latent_motion_frames.to(latent.dtype).to(self.device)
-                        motion_add_noise = torch.randn_like(latent_motion_frames).contiguous()
+                        motion_add_noise = torch.randn(
+                            latent_motion_frames.shape, dtype=latent_motion_frames.dtype,
+                            device=latent_motion_frames.device, generator=generator)
                         add_latent = self.add_noise(latent_motion_frames, motion_add_noise, timesteps[i+1])
                         _, T_m, _, _ = add_latent.shape
                         latent[:, :T_m] = add_latent